@@ -1,27 +1,39 @@
 import os
 import hashlib
+import hmac
+import mimetypes
 import requests # Used for OpenLibrary API calls
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date, timezone
 import random
-from urllib.parse import urljoin
-from flask import Flask, request, jsonify, Blueprint
+from urllib.parse import urljoin, urlparse, unquote, quote, parse_qs
+from flask import Flask, request, jsonify, Blueprint, g, has_request_context, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import (
     JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt,
-    verify_jwt_in_request, get_jwt_identity as _get_jwt_identity
+    verify_jwt_in_request, get_jwt_identity as _get_jwt_identity, get_current_user
 )
 from werkzeug.utils import secure_filename
 import json
+import re
 import time
 import uuid
 import io
 import csv
+import base64
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+import threading
+import tempfile
+import jinja2
+from collections import OrderedDict
+from types import SimpleNamespace
 from functools import wraps
+from contextlib import contextmanager, ExitStack
 # File Processing Libs
 try:
     import docx
@@ -45,12 +57,25 @@ except ImportError:
     canvas = None
     A4 = None
     print("Warning: reportlab not installed. Receipts will be TXT only.")
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, and_, case, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import sqlite3
+try:
+    import fcntl
+except ImportError:  # Windows; single-process dev server only
+    fcntl = None
 try:
     from pypdf import PdfReader
 except ImportError:
     PdfReader = None
     print("Warning: pypdf not installed. Resume parsing will be disabled.")
+# Optional shared cache backend
+try:
+    import redis
+except ImportError:
+    redis = None
 from dotenv import load_dotenv
 
 # Load .env
@@ -71,6 +96,91 @@ SMTP_HOST = os.getenv("SMTP_HOST")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", 30))
+PORTAL_URL = os.getenv("PORTAL_URL", "http://localhost:5173")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+# Pooled SMTP sessions: at most SMTP_POOL_SIZE open connections per process, each reused for
+# up to SMTP_MAX_MESSAGES_PER_CONNECTION messages and dropped after SMTP_IDLE_TIMEOUT seconds idle
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", 60))
+
+# Email outbox: notifications are queued in the request's transaction and sent by background workers
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", 2))  # per process; 0 disables in-process delivery
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 20))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", 5))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BACKOFF = int(os.getenv("EMAIL_RETRY_BACKOFF", 60))  # seconds, doubled per failed attempt
+EMAIL_CLAIM_TIMEOUT = int(os.getenv("EMAIL_CLAIM_TIMEOUT", 300))  # reclaim rows from a crashed worker
+
+# Absence alerts: "digest" buffers them into one email per student every ABSENCE_DIGEST_HOURS;
+# "immediate" sends one per Absent mark. Parents can opt into immediate alerts individually.
+ABSENCE_ALERT_MODE = os.getenv("ABSENCE_ALERT_MODE", "digest").lower()
+ABSENCE_DIGEST_HOURS = float(os.getenv("ABSENCE_DIGEST_HOURS", 24))
+ABSENCE_DIGEST_CHECK_INTERVAL = int(os.getenv("ABSENCE_DIGEST_CHECK_INTERVAL", 300))
+
+# Database engine (DATABASE_URL may point at SQLite or a server database)
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 15000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+# Rows fetched per round trip when streaming large result sets (server-side cursor on PostgreSQL)
+DB_STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", 1000))
+
+# Per-request query instrumentation
+APP_ENV = os.getenv("APP_ENV", "development").lower()
+DB_QUERY_WARN_THRESHOLD = int(os.getenv("DB_QUERY_WARN_THRESHOLD", 25))
+DB_N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", 5))
+
+# Cache (CACHE_URL=redis://... shares entries across workers; unset = in-process)
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", 2048))
+REFDATA_CACHE_TTL = int(os.getenv("REFDATA_CACHE_TTL", 300))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 4096))
+PRESIGN_EXPIRES = int(os.getenv("PRESIGN_EXPIRES", 3600))
+PRESIGN_REFRESH_MARGIN = int(os.getenv("PRESIGN_REFRESH_MARGIN", 300))  # stop handing out a URL this close to expiry
+PRESIGN_CACHE_MAX_ENTRIES = int(os.getenv("PRESIGN_CACHE_MAX_ENTRIES", 8192))
+# Browser-to-storage uploads (see /uploads/presign); files never pass through Flask
+DIRECT_UPLOAD_MAX_BYTES = int(os.getenv("DIRECT_UPLOAD_MAX_BYTES", 500 * 1024 * 1024))
+DIRECT_UPLOAD_EXPIRES = int(os.getenv("DIRECT_UPLOAD_EXPIRES", 900))
+# Multipart transfers through upload_to_minio: part size and parallel part uploads per file
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", 16))
+S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", 16))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 4))
+# Orphan object GC (see collect_orphan_objects). Interval 0 disables the background run;
+# it only reports until STORAGE_GC_DRY_RUN=0.
+STORAGE_GC_INTERVAL = int(os.getenv("STORAGE_GC_INTERVAL", 0))
+STORAGE_GC_DRY_RUN = os.getenv("STORAGE_GC_DRY_RUN", "1") == "1"
+STORAGE_GC_MIN_AGE_HOURS = float(os.getenv("STORAGE_GC_MIN_AGE_HOURS", 24))  # younger objects may belong to in-flight writes
+STORAGE_GC_MAX_DELETES = int(os.getenv("STORAGE_GC_MAX_DELETES", 10000))  # per run
+STORAGE_GC_REQUESTS_PER_SEC = float(os.getenv("STORAGE_GC_REQUESTS_PER_SEC", 5))  # list + delete calls
+# Object storage: "s3" (the MinIO endpoint below) or "local" (files under STORAGE_LOCAL_DIR, downloaded
+# through signed /storage/objects links on this API). STORAGE_CACHE_MAX_MB > 0 keeps recently read S3
+# objects on local disk and routes download links through the API so repeat downloads are served from it.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR")  # default: backend/storage
+STORAGE_PUBLIC_URL = (os.getenv("STORAGE_PUBLIC_URL") or f"http://localhost:{FLASK_RUN_PORT}").rstrip("/")  # this API, as browsers reach it
+STORAGE_CACHE_MAX_MB = int(os.getenv("STORAGE_CACHE_MAX_MB", 0))
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR")  # default: backend/tmp/storage_cache
+STORAGE_CACHE_MAX_OBJECT_MB = int(os.getenv("STORAGE_CACHE_MAX_OBJECT_MB", 32))  # larger objects bypass the cache
+STORAGE_BUCKET_PROBE_BACKOFF = float(os.getenv("STORAGE_BUCKET_PROBE_BACKOFF", 30))  # seconds before re-probing after a failed probe
+# Groq response cache (see GroqResponseCache). Call sites opt in with a TTL; AI_CACHE_PERSIST=1 also
+# keeps answers in the ai_response_cache table so they survive restarts and are shared by workers.
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 512))  # in-process LRU, per worker
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", 3600))  # per-student insights
+AI_SUMMARY_CACHE_TTL = int(os.getenv("AI_SUMMARY_CACHE_TTL", 6 * 3600))  # HRD overview summary
+AI_CACHE_PERSIST = os.getenv("AI_CACHE_PERSIST", "0") == "1"
+AI_CACHE_PURGE_INTERVAL = int(os.getenv("AI_CACHE_PURGE_INTERVAL", 3600))  # expired-row cleanup when persisted
+
+# Serving (see wsgi.py / gunicorn.conf.py). DB_INIT_ON_START=0 skips create_all/seeding at boot.
+DB_INIT_ON_START = os.getenv("DB_INIT_ON_START", "1") == "1"
+DB_INIT_LOCK_ID = 7201  # pg_advisory_lock key shared by every worker
+STORAGE_GC_LOCK_ID = 7202
 
 # -------------------- HARDCODED MINIO CREDENTIALS (kept in-code per request) --------------------
 S3_ENDPOINT = "https://bulk-automatic-groove-sage.trycloudflare.com"
@@ -108,12 +218,109 @@ CORS(
 
 # DB
 DB_PATH = os.path.join(BASE_DIR, "noteorbit.db")
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
+
+
+def resolve_database_url(raw_url=None):
+    """Returns the SQLAlchemy URL to use, defaulting to the bundled SQLite file."""
+    url = raw_url or f"sqlite:///{DB_PATH}"
+    # Heroku/Render style URLs use the legacy "postgres://" scheme
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def build_engine_options(url):
+    """Pool and driver settings for the configured database URL."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        options = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0}}
+        # In-memory databases use a single shared connection; pool sizing does not apply
+        if parsed.database and parsed.database != ":memory:":
+            options.update({
+                "pool_size": DB_POOL_SIZE,
+                "max_overflow": DB_MAX_OVERFLOW,
+                "pool_timeout": DB_POOL_TIMEOUT,
+            })
+        return options
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+@event.listens_for(Engine, "connect")
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    """Tunes every new SQLite connection for concurrent workers (WAL + busy timeout)."""
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        # Negative cache_size is expressed in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+SQLALCHEMY_DATABASE_URI = resolve_database_url(DATABASE_URL)
+app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = build_engine_options(SQLALCHEMY_DATABASE_URI)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 
+# -------------------- DB QUERY INSTRUMENTATION --------------------
+
+def _statement_shape(statement):
+    """Normalises SQL so the same query with different parameters/IN-list sizes compares equal."""
+    shape = re.sub(r"\s+", " ", statement).strip()
+    return re.sub(r"\((?:\s*\?\s*,)+\s*\?\s*\)", "(?)", shape)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _db_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _db_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    starts = conn.info.get("query_start_time")
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    stats = g.get("db_stats")
+    if stats is None:
+        stats = g.db_stats = {"count": 0, "time": 0.0, "shapes": {}}
+    stats["count"] += 1
+    stats["time"] += elapsed
+    shape = _statement_shape(statement)
+    stats["shapes"][shape] = stats["shapes"].get(shape, 0) + 1
+
+
+@app.after_request
+def report_db_stats(response):
+    stats = g.get("db_stats") or {"count": 0, "time": 0.0, "shapes": {}}
+    suspects = {shape: n for shape, n in stats["shapes"].items() if n >= DB_N_PLUS_ONE_THRESHOLD}
+
+    if stats["count"] > DB_QUERY_WARN_THRESHOLD or suspects:
+        print(f"[db] {request.method} {request.path}: {stats['count']} queries in {stats['time'] * 1000:.1f} ms")
+        for shape, n in sorted(suspects.items(), key=lambda x: -x[1]):
+            print(f"[db]   suspected N+1 ({n}x): {shape[:200]}")
+
+    if APP_ENV != "production":
+        response.headers["X-DB-Queries"] = str(stats["count"])
+        response.headers["X-DB-Time"] = f"{stats['time'] * 1000:.2f}ms"
+    return response
+
 SALT = PASSWORD_SALT
 RECEIPT_PREFIX = "fees/"
 
@@ -126,73 +333,855 @@ s3_client = boto3.client(
     region_name="us-east-1",
 )
 
+# Files above the threshold go up as parallel multipart parts read straight from the
+# request's upload stream; memory use is about chunk size x concurrency per upload
+s3_transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * 1024 * 1024,
+    max_concurrency=S3_MAX_CONCURRENCY,
+    use_threads=S3_MAX_CONCURRENCY > 1,
+)
+
+# -------------------- STORAGE BACKENDS --------------------
+
+STORAGE_CHUNK_SIZE = 1024 * 1024
+
+
+def is_no_such_bucket(error):
+    """True for S3 errors meaning the bucket itself is missing (also when wrapped by the transfer manager)."""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in ("NoSuchBucket", "404")
+    return "NoSuchBucket" in str(error)
+
+
+def guess_content_type(key):
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def sign_storage_token(*parts):
+    """HMAC over the given fields, for app-served download links and local upload forms."""
+    message = "\n".join(str(p) for p in parts).encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signed_object_url(key, expires_in):
+    """Download link answered by /storage/objects (local backend, or S3 through the disk cache)."""
+    expires = int(time.time()) + expires_in
+    return (f"{STORAGE_PUBLIC_URL}/storage/objects/{quote(key)}"
+            f"?expires={expires}&signature={sign_storage_token('get', key, expires)}")
+
+
+class BoundedReader:
+    """Reads at most `length` bytes of an open file from its current position."""
+
+    def __init__(self, f, length):
+        self._f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def open_file_range(path, byte_range=None, content_type=None):
+    """(reader, info) for a file on local disk, in the shape StorageBackend.open() returns."""
+    f = open(path, "rb")
+    st = os.fstat(f.fileno())
+    start, end = byte_range or (0, None)
+    if byte_range and start >= st.st_size:
+        f.close()
+        raise ValueError("Requested range not satisfiable")
+    end = st.st_size - 1 if end is None else min(end, st.st_size - 1)
+    f.seek(start)
+    length = max(end - start + 1, 0)
+    return BoundedReader(f, length), {
+        "size": st.st_size, "start": start, "length": length,
+        "etag": '"%x-%x"' % (st.st_mtime_ns, st.st_size), "content_type": content_type or guess_content_type(path),
+    }
+
+
+class StorageBackend:
+    """
+    Object storage used for every stored file. Implementations:
+
+        put(stream, key, content_type, callback=None)   write an object; callback(n) as n more bytes are sent
+        open(key, byte_range=None) -> (reader, info)     info: size, start, length, etag, content_type
+        head(key) -> {"size", "etag", "content_type"} or None if missing
+        presign(key, expires_in)                         time-limited download URL
+        presign_post(key, content_type, max_bytes, expires_in) -> {"url", "fields"} for a browser POST
+        delete(key), delete_many(keys) -> [(key, error code)]
+        list_pages(prefix, page_size) -> iterator of [{"key", "size", "modified"}]
+        ensure_bucket(force=False), key_from_url(url)
+
+    byte_range=(start, end) is inclusive; end None reads to the end of the object. Missing
+    objects raise FileNotFoundError, unsatisfiable ranges ValueError.
+    """
+
+    def get(self, key):
+        reader, _ = self.open(key)
+        try:
+            return reader.read()
+        finally:
+            reader.close()
+
+    def stream(self, key, byte_range=None):
+        return self.open(key, byte_range)[0]
+
+
+class S3StorageBackend(StorageBackend):
+    """The MinIO (S3 compatible) bucket. Large puts go through s3_transfer_config as multipart uploads."""
+
+    name = "s3"
+
+    def __init__(self, client, bucket=S3_BUCKET):
+        self.client = client
+        self.bucket = bucket
+        self._ready = False
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _probe_failed(self, message):
+        # Uploads within the backoff skip the probe instead of repeating it per request
+        print(message)
+        self._retry_at = time.monotonic() + STORAGE_BUCKET_PROBE_BACKOFF
+        return False
+
+    def ensure_bucket(self, force=False):
+        """
+        Probes for the bucket (creating it if missing) once per process instead of before
+        every upload. force=True re-probes, used after an upload reports NoSuchBucket.
+        A failed probe is not repeated for STORAGE_BUCKET_PROBE_BACKOFF seconds.
+        """
+        if self._ready and not force:
+            return True
+        with self._lock:
+            if self._ready and not force:
+                return True
+            if not force and time.monotonic() < self._retry_at:
+                return False
+            try:
+                self.client.head_bucket(Bucket=self.bucket)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code in ("403", "AccessDenied", "Forbidden"):
+                    # Keys scoped to objects may not be allowed HeadBucket; the bucket is there
+                    self._ready = True
+                    return True
+                if not is_no_such_bucket(e):
+                    return self._probe_failed(f"Bucket probe failed for {self.bucket}: {e}")
+                try:
+                    self.client.create_bucket(Bucket=self.bucket)
+                except ClientError as ce:
+                    # Another worker may have created it in the meantime
+                    if ce.response.get("Error", {}).get("Code") not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                        return self._probe_failed(f"Bucket create failed for {self.bucket}: {ce}")
+            except Exception as e:
+                # Endpoint unreachable: leave unset so an upload after the backoff probes again
+                return self._probe_failed(f"Bucket probe failed for {self.bucket}: {e}")
+            self._ready = True
+            return True
+
+    def put(self, stream, key, content_type, callback=None):
+        self.client.upload_fileobj(
+            stream, self.bucket, key,
+            ExtraArgs={"ContentType": content_type}, Config=s3_transfer_config, Callback=callback,
+        )
+
+    def open(self, key, byte_range=None):
+        params = {"Bucket": self.bucket, "Key": key}
+        if byte_range:
+            start, end = byte_range
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            resp = self.client.get_object(**params)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("NoSuchKey", "404"):
+                raise FileNotFoundError(key) from e
+            if code == "InvalidRange":
+                raise ValueError("Requested range not satisfiable") from e
+            raise
+        start = 0
+        length = size = resp["ContentLength"]
+        if resp.get("ContentRange"):  # "bytes start-end/size"
+            span, _, total = resp["ContentRange"].split(" ", 1)[-1].partition("/")
+            start, size = int(span.split("-")[0]), int(total)
+        return resp["Body"], {"size": size, "start": start, "length": length,
+                              "etag": resp.get("ETag"), "content_type": resp.get("ContentType")}
+
+    def head(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {"size": head["ContentLength"], "etag": head["ETag"], "content_type": head.get("ContentType")}
+
+    def presign(self, key, expires_in):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in
+        )
+
+    def presign_post(self, key, content_type, max_bytes, expires_in):
+        return self.client.generate_presigned_post(
+            self.bucket, key,
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+            ExpiresIn=expires_in,
+        )
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_many(self, keys):
+        """One DeleteObjects request; at most 1000 keys."""
+        result = self.client.delete_objects(
+            Bucket=self.bucket, Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True}
+        )
+        return [(e["Key"], e.get("Code")) for e in result.get("Errors", [])]
+
+    def list_pages(self, prefix="", page_size=1000):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, PaginationConfig={"PageSize": page_size}):
+            yield [{"key": o["Key"], "size": o.get("Size", 0), "modified": o["LastModified"]}
+                   for o in page.get("Contents", [])]
+
+    def key_from_url(self, url):
+        """
+        Matches on the /bucket/ path whatever the host: stored presigned URLs outlive the
+        tunnel host they were minted for. On another host the URL must carry a presign
+        signature, so an unrelated link such as https://github.com/noteorbit/... is not ours.
+        """
+        parsed = urlparse(url or "")
+        prefix = f"/{self.bucket}/"
+        if not parsed.path.startswith(prefix):
+            return None
+        if parsed.netloc != urlparse(self.client.meta.endpoint_url).netloc:
+            query = parse_qs(parsed.query)
+            if "X-Amz-Signature" not in query and "Signature" not in query:
+                return None
+        return unquote(parsed.path[len(prefix):]) or None
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Objects as files under one directory, for offline development and benchmarks. Downloads
+    and browser uploads go through the signed /storage routes; content types come from the
+    key's extension.
+    """
+
+    name = "local"
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def ensure_bucket(self, force=False):
+        os.makedirs(self.root, exist_ok=True)
+        return True
+
+    def put(self, stream, key, content_type, callback=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write beside the target and rename, so readers never see a partial object
+        tmp = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in iter(lambda: stream.read(STORAGE_CHUNK_SIZE), b""):
+                    out.write(chunk)
+                    if callback:
+                        callback(len(chunk))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def open(self, key, byte_range=None):
+        return open_file_range(self._path(key), byte_range)
+
+    def head(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return {"size": st.st_size, "etag": '"%x-%x"' % (st.st_mtime_ns, st.st_size), "content_type": guess_content_type(key)}
+
+    def presign(self, key, expires_in):
+        return signed_object_url(key, expires_in)
+
+    def presign_post(self, key, content_type, max_bytes, expires_in):
+        expires = int(time.time()) + expires_in
+        fields = {"key": key, "Content-Type": content_type, "max_bytes": str(max_bytes), "expires": str(expires)}
+        fields["signature"] = sign_storage_token("post", key, content_type, max_bytes, expires)
+        return {"url": f"{STORAGE_PUBLIC_URL}/storage/uploads", "fields": fields}
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_many(self, keys):
+        errors = []
+        for key in keys:
+            try:
+                self.delete(key)
+            except (OSError, ValueError) as e:
+                errors.append((key, type(e).__name__))
+        return errors
+
+    def list_pages(self, prefix="", page_size=1000):
+        keys = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+                if not name.endswith(".part") and key.startswith(prefix):
+                    keys.append(key)
+        keys.sort()
+        for i in range(0, len(keys), page_size):
+            page = []
+            for key in keys[i:i + page_size]:
+                try:
+                    st = os.stat(self._path(key))
+                except FileNotFoundError:
+                    continue
+                page.append({"key": key, "size": st.st_size, "modified": datetime.fromtimestamp(st.st_mtime, timezone.utc)})
+            yield page
+
+    def key_from_url(self, url):
+        return None  # its links are app-served; see object_key_from_url
+
+
+class DiskObjectCache:
+    """
+    Size-bounded LRU of object bodies on local disk, shared by the workers on one host.
+    Entries are files named by a hash of the key; a hit bumps the file's mtime and eviction
+    drops the least recently used files once the directory passes max_bytes. Each process
+    rescans the directory after writing a tenth of the budget, so it can overshoot by about
+    that much per worker. Writes and deletes through the backend remove the entry.
+    """
+
+    def __init__(self, directory, max_bytes, max_object_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self._lock = threading.Lock()
+        self._written = 0
+        self.hits = self.misses = self.fills = self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def lookup(self, key):
+        """Path of the cached body (marked as recently used), or None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def fill(self, key, body):
+        """Copies a body stream into the cache and closes it. Returns the entry's path."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.part"
+        written = 0
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in iter(lambda: body.read(STORAGE_CHUNK_SIZE), b""):
+                    out.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            body.close()
+        with self._lock:
+            self.fills += 1
+            self._written += written
+            rescan = self._written > self.max_bytes // 10
+            if rescan:
+                self._written = 0
+        if rescan:
+            self.evict()
+        return path
+
+    def invalidate(self, key):
+        self._remove(self._path(key))
+
+    def evict(self):
+        """Removes least recently used entries until the cache is back under 90% of max_bytes."""
+        entries, total = [], 0
+        for dirpath, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".part"):
+                    # Left behind by a worker that died mid-fill
+                    if st.st_mtime < time.time() - 3600:
+                        self._remove(path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 0.9:
+                break
+            self._remove(path)
+            total -= size
+            evicted += 1
+        with self._lock:
+            self.evictions += evicted
+        return evicted
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            hits, misses, fills, evictions = self.hits, self.misses, self.fills, self.evictions
+        lookups = hits + misses
+        return {
+            "hits": hits, "misses": misses, "fills": fills, "evictions": evictions,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "max_mb": self.max_bytes // 1048576, "max_object_mb": self.max_object_bytes // 1048576,
+        }
+
+
+class CachedStorageBackend(StorageBackend):
+    """
+    Wraps a remote backend with a DiskObjectCache. Reads of objects up to max_object_bytes
+    are served from disk after the first, and download links point at /storage/objects so
+    browser downloads are too; everything else is passed through.
+    """
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.name = f"{backend.name}+disk-cache"
+
+    def __getattr__(self, attr):
+        return getattr(self.backend, attr)
+
+    def put(self, stream, key, content_type, callback=None):
+        try:
+            self.backend.put(stream, key, content_type, callback)
+        finally:
+            self.cache.invalidate(key)
+
+    def open(self, key, byte_range=None):
+        path = self.cache.lookup(key)
+        if path:
+            try:
+                return open_file_range(path, byte_range, guess_content_type(key))
+            except FileNotFoundError:
+                pass  # evicted since the lookup
+        if byte_range:
+            # Only fetch the whole object for a range when it will be cached
+            head = self.backend.head(key)
+            if head is None:
+                raise FileNotFoundError(key)
+            if head["size"] > self.cache.max_object_bytes:
+                return self.backend.open(key, byte_range)
+        body, info = self.backend.open(key)
+        if info["size"] > self.cache.max_object_bytes:
+            return body, info
+        path = self.cache.fill(key, body)
+        return open_file_range(path, byte_range, info["content_type"] or guess_content_type(key))
+
+    def presign(self, key, expires_in):
+        return signed_object_url(key, expires_in)
+
+    def delete(self, key):
+        try:
+            self.backend.delete(key)
+        finally:
+            self.cache.invalidate(key)
+
+    def delete_many(self, keys):
+        try:
+            return self.backend.delete_many(keys)
+        finally:
+            for key in keys:
+                self.cache.invalidate(key)
+
+
+def create_storage_backend(kind=STORAGE_BACKEND):
+    if kind == "local":
+        if STORAGE_CACHE_MAX_MB:
+            print("Warning: STORAGE_CACHE_MAX_MB is ignored with the local storage backend.")
+        return LocalStorageBackend(STORAGE_LOCAL_DIR or os.path.join(BASE_DIR, "storage"))
+    if kind != "s3":
+        print(f"Warning: unknown STORAGE_BACKEND {kind!r}. Falling back to s3.")
+    backend = S3StorageBackend(s3_client)
+    if STORAGE_CACHE_MAX_MB > 0:
+        cache = DiskObjectCache(
+            STORAGE_CACHE_DIR or os.path.join(TEMP_DIR, "storage_cache"),
+            STORAGE_CACHE_MAX_MB * 1024 * 1024, STORAGE_CACHE_MAX_OBJECT_MB * 1024 * 1024,
+        )
+        return CachedStorageBackend(backend, cache)
+    return backend
+
+
+storage = create_storage_backend()
+
+# -------------------- CACHE --------------------
+
+class LocalCacheBackend:
+    """
+    Thread-safe in-process LRU with per-entry TTL. Stand-in for a shared cache.
+    Counters (incr/counter) live outside the LRU: evicting a version stamp would reset it
+    and bring back entries it had retired.
+    """
+
+    def __init__(self, max_entries=CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class RedisCacheBackend:
+    """Shared cache for multi-worker deployments. Values are stored as JSON."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, json.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def counter(self, key):
+        return int(self.client.get(key) or 0)
+
+
+def create_cache_backend(url=CACHE_URL):
+    if url and url.startswith("redis"):
+        if redis is None:
+            print("Warning: redis not installed. Falling back to in-process cache.")
+        else:
+            return RedisCacheBackend(url)
+    return LocalCacheBackend()
+
+
+cache_backend = create_cache_backend()
+
+
+def _refdata_version(name):
+    return cache_backend.counter(f"refdata:{name}:version")
+
+
+def cached_reference(name, loader, *key_parts, ttl=REFDATA_CACHE_TTL):
+    """
+    Read-through cache for rarely changing reference data (degrees, sections, ...).
+    Entries are keyed by the dataset's version stamp, so invalidate_reference()
+    retires every cached variant of that dataset at once.
+    """
+    key = f"refdata:{name}:v{_refdata_version(name)}:" + ":".join(str(p) for p in key_parts)
+    try:
+        value = cache_backend.get(key)
+    except Exception as e:
+        print(f"Cache read failed for {key}: {e}")
+        return loader()
+    if value is None:
+        value = loader()
+        try:
+            cache_backend.set(key, value, ttl=ttl)
+        except Exception as e:
+            print(f"Cache write failed for {key}: {e}")
+    return value
+
+
+def invalidate_reference(*names):
+    for name in names:
+        try:
+            cache_backend.incr(f"refdata:{name}:version")
+        except Exception as e:
+            print(f"Cache invalidation failed for {name}: {e}")
+
+
 # -------------------- HELPERS --------------------
 
-def send_email(to_email, subject, body):
-    if not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
+def smtp_configured():
+    return bool(SMTP_HOST and SMTP_USER and SMTP_PASS)
+
+
+def build_email_message(sender, to_email, subject, body, text_body=None):
+    # With a plain-text part the message is multipart/alternative; clients pick the last part they can show
+    msg = MIMEMultipart('alternative') if text_body else MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    if text_body:
+        msg.attach(MIMEText(text_body, 'plain'))
+    msg.attach(MIMEText(body, 'html')) # Changed to HTML for better formatting
+    return msg.as_string()
+
+
+# Errors after which the session is unusable and a fresh connection may succeed
+SMTP_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class PooledSMTPConnection:
+    """One authenticated SMTP session checked out of an SMTPConnectionPool."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.server = None
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def send(self, to_email, subject, body, text_body=None):
+        """Sends one message, reconnecting once if the server dropped the session."""
+        payload = build_email_message(self.pool.sender, to_email, subject, body, text_body)
+        for attempt in (1, 2):
+            if self.server is None:
+                self.server = self.pool.connect()
+            try:
+                self.server.sendmail(self.pool.sender, to_email, payload)
+                break
+            except SMTP_CONNECTION_ERRORS:
+                self.close()
+                if attempt == 2:
+                    raise
+        self.sent += 1
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+
+class SMTPPoolExhausted(TimeoutError):
+    """No pooled SMTP slot freed up within the pool timeout."""
+
+
+class SMTPConnectionPool:
+    """
+    Keeps logged-in SMTP sessions open between messages instead of paying a TCP + STARTTLS +
+    AUTH handshake per email. A semaphore caps concurrent connections; idle sessions are
+    reused most-recent-first and retired after max_messages or idle_timeout.
+    """
+
+    def __init__(self, host, port, user=None, password=None, sender=None, size=4, starttls=True,
+                 timeout=30, max_messages=100, idle_timeout=60):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.sender = sender or user
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.connections_opened = 0
+
+    def connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return server
+
+    def _checkout(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sockets inherited across fork belong to the parent; start clean
+                self._idle, self._pid = [], os.getpid()
+            while self._idle:
+                conn = self._idle.pop()
+                if time.monotonic() - conn.last_used < self.idle_timeout:
+                    return conn
+                conn.close()
+        return PooledSMTPConnection(self)
+
+    def _checkin(self, conn):
+        if conn.server is None or conn.sent >= self.max_messages:
+            conn.close()
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def session(self):
+        """Holds one pooled connection for a batch of sends."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise SMTPPoolExhausted("No SMTP connection available")
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except SMTP_CONNECTION_ERRORS:
+            if conn is not None:
+                conn.close()
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+            self._slots.release()
+
+    def send(self, to_email, subject, body, text_body=None):
+        with self.session() as conn:
+            conn.send(to_email, subject, body, text_body)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+smtp_pool = SMTPConnectionPool(
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, size=SMTP_POOL_SIZE, starttls=SMTP_STARTTLS,
+    timeout=SMTP_TIMEOUT, max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION, idle_timeout=SMTP_IDLE_TIMEOUT,
+)
+
+
+def deliver_email(to_email, subject, body, text_body=None):
+    """Sends one HTML email (plus optional plain-text part) over a pooled SMTP session. Raises on failure."""
+    smtp_pool.send(to_email, subject, body, text_body)
+
+
+def send_email(to_email, subject, body, text_body=None):
+    """Synchronous send, for flows that must report delivery in the response (OTP, credentials)."""
+    if not smtp_configured():
         print("SMTP not configured. Skipping email.")
         return False
     try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html')) # Changed to HTML for better formatting
-
-        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASS)
-        server.sendmail(SMTP_USER, to_email, msg.as_string())
-        server.quit()
+        deliver_email(to_email, subject, body, text_body)
         return True
     except Exception as e:
         print(f"Failed to send email: {e}")
         return False
 
-def send_professional_email(to_email, subject, title, details, main_body):
-    """
-    Sends a professionally styled HTML email.
-    details: dict of {'Label': 'Value'}
-    """
-    if not to_email:
-        return False
-        
-    html_content = f"""
+PROFESSIONAL_EMAIL_HTML = """
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f9; color: #333; margin: 0; padding: 0; }}
-            .container {{ max-width: 600px; margin: 20px auto; background: #ffffff; border-radius: 12px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); overflow: hidden; border-left: 5px solid #4f46e5; }}
-            .header {{ background-color: #fff; padding: 30px 40px; border-bottom: 1px solid #eee; }}
-            .header h1 {{ margin: 0; color: #4f46e5; font-size: 24px; letter-spacing: -0.5px; }}
-            .header p {{ margin: 5px 0 0; color: #6b7280; font-size: 14px; text-transform: uppercase; letter-spacing: 1px; font-weight: 600; }}
-            .content {{ padding: 30px 40px; line-height: 1.6; color: #374151; }}
-            .details-box {{ background-color: #f9fafb; border: 1px solid #e5e7eb; border-radius: 8px; padding: 20px; margin: 25px 0; }}
-            .detail-row {{ display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid #eee; }}
-            .detail-row:last-child {{ border-bottom: none; }}
-            .label {{ color: #6b7280; font-weight: 500; font-size: 13px; }}
-            .value {{ color: #111827; font-weight: 600; font-size: 14px; text-align: right; }}
-            .footer {{ background-color: #f9fafb; padding: 20px 40px; text-align: center; font-size: 12px; color: #9ca3af; border-top: 1px solid #eee; }}
-            .btn {{ display: inline-block; background-color: #4f46e5; color: white; padding: 10px 20px; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600; margin-top: 10px; }}
+            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f9; color: #333; margin: 0; padding: 0; }
+            .container { max-width: 600px; margin: 20px auto; background: #ffffff; border-radius: 12px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); overflow: hidden; border-left: 5px solid #4f46e5; }
+            .header { background-color: #fff; padding: 30px 40px; border-bottom: 1px solid #eee; }
+            .header h1 { margin: 0; color: #4f46e5; font-size: 24px; letter-spacing: -0.5px; }
+            .header p { margin: 5px 0 0; color: #6b7280; font-size: 14px; text-transform: uppercase; letter-spacing: 1px; font-weight: 600; }
+            .content { padding: 30px 40px; line-height: 1.6; color: #374151; }
+            .details-box { background-color: #f9fafb; border: 1px solid #e5e7eb; border-radius: 8px; padding: 20px; margin: 25px 0; }
+            .detail-row { display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid #eee; }
+            .detail-row:last-child { border-bottom: none; }
+            .label { color: #6b7280; font-weight: 500; font-size: 13px; }
+            .value { color: #111827; font-weight: 600; font-size: 14px; text-align: right; }
+            .footer { background-color: #f9fafb; padding: 20px 40px; text-align: center; font-size: 12px; color: #9ca3af; border-top: 1px solid #eee; }
+            .btn { display: inline-block; background-color: #4f46e5; color: white; padding: 10px 20px; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600; margin-top: 10px; }
         </style>
     </head>
     <body>
         <div class="container">
             <div class="header">
                 <p>NoteOrbit Notification</p>
-                <h1>{title}</h1>
+                <h1>{{ title }}</h1>
             </div>
             <div class="content">
                 <p>Dear User,</p>
-                <p>{main_body}</p>
+                <p>{{ main_body|safe }}</p>
                 
                 <div class="details-box">
-                    {"".join([f'<div class="detail-row"><span class="label">{k}</span><span class="value">{v}</span></div>' for k, v in details.items()])}
+                    {% for label, value in details.items() %}<div class="detail-row"><span class="label">{{ label }}</span><span class="value">{{ value }}</span></div>{% endfor %}
                 </div>
                 
                 <p>Please log in to the portal to view full details.</p>
-                <center><a href="http://localhost:5173" class="btn">Login to NoteOrbit</a></center>
+                <center><a href="{{ portal_url }}" class="btn">Login to NoteOrbit</a></center>
             </div>
             <div class="footer">
                 &copy; 2025 NoteOrbit Academic System by LeafCore Labs. All rights reserved.<br>
@@ -202,7 +1191,159 @@ def send_professional_email(to_email, subject, title, details, main_body):
     </body>
     </html>
     """
-    return send_email(to_email, subject, html_content)
+
+PROFESSIONAL_EMAIL_TEXT = """{{ title }}
+
+Dear User,
+
+{{ main_body|striptags }}
+
+{% for label, value in details.items() %}{{ label }}: {{ value }}
+{% endfor %}
+Please log in to the portal to view full details: {{ portal_url }}
+
+--
+NoteOrbit Academic System by LeafCore Labs.
+This is an automated message. Please do not reply.
+"""
+
+PARENT_QUERY_EMAIL_HTML = """
+    <div style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; border: 1px solid #eee; border-radius: 8px; overflow: hidden;">
+        <div style="background-color: #3b82f6; padding: 20px; color: white;">
+            <h2 style="margin: 0;">Parent Communication</h2>
+            <p style="margin: 5px 0 0; opacity: 0.9;">From the desk of {{ student_name }}'s Guardian</p>
+        </div>
+        <div style="padding: 30px;">
+            <p><strong>To:</strong> Prof. {{ professor_name }}</p>
+            <p><strong>Regarding Student:</strong> {{ student_name }} ({{ srn }})</p>
+            <p><strong>Class:</strong> {{ degree }} - Sem {{ semester }} (Sec {{ section }})</p>
+            <hr style="border: 0; border-top: 1px solid #eee; margin: 20px 0;">
+            
+            <h3 style="color: #3b82f6; margin-top: 0;">{{ subject }}</h3>
+            <p style="background-color: #f9fafb; padding: 15px; border-radius: 6px; border-left: 4px solid #3b82f6;">
+                "{{ message }}"
+            </p>
+            
+            <p style="margin-top: 30px; font-size: 13px; color: #666;">
+                You can reply directly to this email to contact the parent at <a href="mailto:{{ reply_to }}">{{ reply_to }}</a>.
+            </p>
+        </div>
+         <div style="background-color: #f4f4f9; padding: 15px; text-align: center; font-size: 12px; color: #999;">
+            NoteOrbit Academic Portal
+        </div>
+    </div>
+    """
+
+PARENT_QUERY_EMAIL_TEXT = """Parent Communication from {{ student_name }}'s Guardian
+
+To: Prof. {{ professor_name }}
+Regarding Student: {{ student_name }} ({{ srn }})
+Class: {{ degree }} - Sem {{ semester }} (Sec {{ section }})
+
+{{ subject }}
+
+"{{ message }}"
+
+You can contact the parent at {{ reply_to }}.
+
+--
+NoteOrbit Academic Portal
+"""
+
+FACULTY_REPLY_EMAIL_HTML = """
+    <div style="font-family: Arial, sans-serif; padding: 20px;">
+        <p><strong>From:</strong> Prof. {{ professor_name }}</p>
+        <hr/>
+        <p>{{ reply }}</p>
+        <p style="color: #666; font-size: 12px; margin-top: 20px;">
+           Reply strictly via email or check the portal.
+        </p>
+    </div>
+    """
+
+FACULTY_REPLY_EMAIL_TEXT = """From: Prof. {{ professor_name }}
+
+{{ reply }}
+
+Reply strictly via email or check the portal.
+"""
+
+PARENT_REPLY_EMAIL_HTML = """
+    <div style="padding: 20px;">
+        <p><strong>Parent Reply:</strong></p>
+        <p>{{ reply }}</p>
+        <p style="color: #666; font-size: 12px; margin-top: 20px;">Login to portal to reply.</p>
+    </div>
+    """
+
+PARENT_REPLY_EMAIL_TEXT = """Parent Reply:
+
+{{ reply }}
+
+Login to portal to reply.
+"""
+
+# HTML autoescapes interpolated values (main_body opts out: callers embed <strong> tags); text does not
+_email_html_env = jinja2.Environment(autoescape=True)
+_email_text_env = jinja2.Environment(autoescape=False, keep_trailing_newline=True)
+
+
+class EmailTemplate:
+    """An email layout compiled once; render() fills in per-recipient fields and times itself."""
+
+    def __init__(self, name, html, text):
+        self.name = name
+        self.html = _email_html_env.from_string(html)
+        self.text = _email_text_env.from_string(text)
+        self.renders = 0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def render(self, **context):
+        """Returns (html, text)."""
+        started = time.perf_counter()
+        html = self.html.render(**context)
+        text = self.text.render(**context)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += elapsed
+        return html, text
+
+    def stats(self):
+        with self._lock:
+            renders, seconds = self.renders, self.render_seconds
+        return {
+            "renders": renders,
+            "total_ms": round(seconds * 1000, 3),
+            "avg_ms": round(seconds * 1000 / renders, 4) if renders else None,
+        }
+
+
+EMAIL_TEMPLATES = {}
+
+
+def register_email_template(name, html, text):
+    EMAIL_TEMPLATES[name] = EmailTemplate(name, html, text)
+    return EMAIL_TEMPLATES[name]
+
+
+def render_email_template(name, **context):
+    return EMAIL_TEMPLATES[name].render(**context)
+
+
+register_email_template("professional", PROFESSIONAL_EMAIL_HTML, PROFESSIONAL_EMAIL_TEXT)
+register_email_template("parent_query", PARENT_QUERY_EMAIL_HTML, PARENT_QUERY_EMAIL_TEXT)
+register_email_template("faculty_reply", FACULTY_REPLY_EMAIL_HTML, FACULTY_REPLY_EMAIL_TEXT)
+register_email_template("parent_reply", PARENT_REPLY_EMAIL_HTML, PARENT_REPLY_EMAIL_TEXT)
+
+
+def render_professional_email(title, details, main_body):
+    """
+    Renders the professionally styled notification email. Returns (html, text).
+    details: dict of {'Label': 'Value'}
+    """
+    return render_email_template("professional", title=title, details=details, main_body=main_body, portal_url=PORTAL_URL)
 
 
 
@@ -220,31 +1361,214 @@ def allowed_file(filename: str):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED
 
 
-def upload_to_minio(file_obj, dest_key: str, content_type: str = "application/octet-stream"):
-    """Handles file upload to MinIO (S3 compatible). Returns presigned URL and key."""
+class PresignCache:
+    """
+    Reuses presigned GET URLs per (object key, expiry) until they are within `margin`
+    seconds of expiring, so list endpoints do not re-sign every row on every request.
+    Kept per process: signing is local HMAC work, cheaper than a shared-cache round trip.
+    """
+
+    def __init__(self, max_entries=PRESIGN_CACHE_MAX_ENTRIES, margin=PRESIGN_REFRESH_MARGIN):
+        self.margin = margin
+        self._cache = LocalCacheBackend(max_entries=max_entries)
+        self._expiries = {PRESIGN_EXPIRES}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.errors = 0
+
+    def _cache_key(self, key, expires_in):
+        return f"{S3_BUCKET}:{expires_in}:{key}"
+
+    def url(self, key, expires_in=PRESIGN_EXPIRES):
+        """Presigned URL for one key, or None if the key is empty or signing fails."""
+        return self.urls([key], expires_in).get(key)
+
+    def urls(self, keys, expires_in=PRESIGN_EXPIRES):
+        """Batch form for list responses: {key: url or None}, each distinct key signed at most once."""
+        out = {}
+        hits = misses = errors = 0
+        ttl = expires_in - self.margin
+        for key in keys:
+            if not key or key in out:
+                continue
+            cache_key = self._cache_key(key, expires_in)
+            url = self._cache.get(cache_key)
+            if url is not None:
+                hits += 1
+            else:
+                misses += 1
+                try:
+                    url = storage.presign(key, expires_in)
+                except Exception as e:
+                    errors += 1
+                    print(f"Presign failed for {key}: {e}")
+                if url is not None and ttl > 0:
+                    self._cache.set(cache_key, url, ttl=ttl)
+            out[key] = url
+        with self._lock:
+            self.hits += hits; self.misses += misses; self.errors += errors
+            self._expiries.add(expires_in)
+        return out
+
+    def invalidate(self, key):
+        with self._lock:
+            expiries = list(self._expiries)
+        for expires_in in expiries:
+            self._cache.delete(self._cache_key(key, expires_in))
+
+    def stats(self):
+        with self._lock:
+            hits, misses, errors = self.hits, self.misses, self.errors
+        lookups = hits + misses
+        return {
+            "hits": hits, "misses": misses, "errors": errors,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "entries": len(self._cache), "margin_seconds": self.margin,
+        }
+
+
+presign_cache = PresignCache()
+
+
+def presigned_url(key, expires_in=PRESIGN_EXPIRES):
+    return presign_cache.url(key, expires_in)
+
+
+def presigned_urls(keys, expires_in=PRESIGN_EXPIRES):
+    return presign_cache.urls(keys, expires_in)
+
+
+class UploadProgress:
+    """
+    Transfer callback for one upload. Part threads report bytes as they are sent;
+    on_progress(sent, total), if given, is called from those threads too.
+    """
+
+    def __init__(self, key, total=None, on_progress=None):
+        self.key = key
+        self.total = total
+        self.sent = 0
+        self.on_progress = on_progress
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_sent):
+        with self._lock:
+            self.sent += bytes_sent
+            sent = self.sent
+        if self.on_progress:
+            self.on_progress(sent, self.total)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class UploadStats:
+    """Process-wide totals for upload_to_minio, served at /admin/storage/upload-stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = self.multipart = self.failures = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.dedup_hits = self.dedup_bytes = 0
+
+    def record(self, progress, ok):
+        with self._lock:
+            if not ok:
+                self.failures += 1
+                return
+            self.uploads += 1
+            self.bytes += progress.sent
+            self.seconds += progress.elapsed
+            if progress.sent >= s3_transfer_config.multipart_threshold:
+                self.multipart += 1
+
+    def record_dedup(self, size):
+        with self._lock:
+            self.dedup_hits += 1
+            self.dedup_bytes += size
+
+    def stats(self):
+        with self._lock:
+            uploads, multipart, failures, sent, seconds = self.uploads, self.multipart, self.failures, self.bytes, self.seconds
+            dedup_hits, dedup_bytes = self.dedup_hits, self.dedup_bytes
+        return {
+            "uploads": uploads, "multipart_uploads": multipart, "failures": failures,
+            "bytes": sent, "total_seconds": round(seconds, 3),
+            "dedup_hits": dedup_hits, "dedup_bytes_saved": dedup_bytes,
+            "avg_mb_per_sec": round(sent / 1048576 / seconds, 2) if seconds else None,
+            "part_size_mb": S3_MULTIPART_CHUNK_MB, "max_concurrency": S3_MAX_CONCURRENCY,
+        }
+
+
+upload_stats = UploadStats()
+
+
+def stream_size(stream):
+    """Remaining bytes in a seekable stream, or None."""
     try:
-        # Ensure bucket exists
-        s3_client.head_bucket(Bucket=S3_BUCKET)
+        pos = stream.tell()
+        end = stream.seek(0, os.SEEK_END)
+        stream.seek(pos)
+        return end - pos
     except Exception:
-        try:
-            s3_client.create_bucket(Bucket=S3_BUCKET)
-        except Exception:
-            pass
+        return None
 
-    # If file_obj is a werkzeug FileStorage, it has .stream; but upload_fileobj accepts file-like
-    s3_client.upload_fileobj(
-        file_obj,
-        S3_BUCKET,
-        dest_key,
-        ExtraArgs={"ContentType": content_type},
-    )
 
-    url = s3_client.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": S3_BUCKET, "Key": dest_key},
-        ExpiresIn=3600,
-    )
-    return url, dest_key
+def upload_to_minio(file_obj, dest_key: str, content_type: str = "application/octet-stream", on_progress=None):
+    """
+    Handles file upload to the storage backend. Returns presigned URL and key.
+    on_progress(sent_bytes, total_bytes) is called as parts complete.
+    """
+    storage.ensure_bucket()
+
+    # Hand the transfer manager werkzeug's own upload stream (in memory, or the spooled
+    # temp file for large bodies) so parts are read from it directly, without another copy
+    stream = getattr(file_obj, "stream", file_obj)
+    progress = UploadProgress(dest_key, stream_size(stream), on_progress)
+    try:
+        storage.put(stream, dest_key, content_type, callback=progress)
+    except Exception as e:
+        upload_stats.record(progress, ok=False)
+        # The bucket vanished since it was checked (e.g. storage reset): re-create it for the
+        # next upload. This one still fails; the transfer manager has already closed file_obj.
+        if is_no_such_bucket(e):
+            storage.ensure_bucket(force=True)
+        raise
+    upload_stats.record(progress, ok=True)
+    if progress.sent >= s3_transfer_config.multipart_threshold:
+        print(f"[storage] {dest_key}: {progress.sent / 1048576:.1f} MB in {progress.elapsed:.2f}s "
+              f"({progress.sent / 1048576 / max(progress.elapsed, 1e-6):.1f} MB/s)")
+
+    # A re-upload to the same key must not keep serving a URL signed for the old object
+    presign_cache.invalidate(dest_key)
+    return presigned_url(dest_key), dest_key
+
+
+def object_etag(key):
+    head = storage.head(key)
+    if head is None:
+        raise FileNotFoundError(key)
+    return head["etag"]
+
+
+def get_object_stream(key, byte_range=None):
+    """
+    Streaming read of a stored object, without presigning or an HTTP hop.
+    byte_range=(start, end) is inclusive; end None reads to the end of the object.
+    """
+    return storage.stream(key, byte_range)
+
+
+def object_key_from_url(url):
+    """The key of one of our objects from a (possibly expired) presigned or app-served URL, else None."""
+    parsed = urlparse(url or "")
+    public = urlparse(STORAGE_PUBLIC_URL)
+    prefix = f"{public.path}/storage/objects/"
+    if parsed.netloc == public.netloc and parsed.path.startswith(prefix):
+        return unquote(parsed.path[len(prefix):]) or None
+    return storage.key_from_url(url)
 
 
 def cents_to_rupees_str(amount_cents):
@@ -308,12 +1632,7 @@ def upload_receipt(path_local, dest_key=None):
     with open(path_local, "rb") as f:
         upload_to_minio(f, dest_key, content_type)
 
-    presigned = s3_client.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": S3_BUCKET, "Key": dest_key},
-        ExpiresIn=3600,
-    )
-    return dest_key, presigned
+    return dest_key, presigned_url(dest_key)
 
 
 # -------------------- LIBRARY HELPER --------------------
@@ -352,6 +1671,134 @@ def search_open_library(query: str):
         return []
 
 
+# -------------------- PAGINATION --------------------
+
+PAGE_DEFAULT_LIMIT = 50
+PAGE_MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+@app.errorhandler(PaginationError)
+def handle_pagination_error(e):
+    return jsonify({"success": False, "message": str(e)}), 400
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=lambda v: v.isoformat(), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, columns):
+    """Decodes an opaque cursor back into typed values for the given sort columns."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(raw, list) or len(raw) != len(columns):
+            raise ValueError("cursor shape mismatch")
+        values = []
+        for col, v in zip(columns, raw):
+            py_type = col.type.python_type
+            if v is None:
+                values.append(None)
+            elif py_type is datetime:
+                values.append(datetime.fromisoformat(v))
+            elif py_type is date:
+                values.append(date.fromisoformat(v))
+            else:
+                values.append(py_type(v))
+        return values
+    except Exception:
+        raise PaginationError("Invalid cursor")
+
+
+def get_page_args():
+    """
+    Reads ?limit= and ?cursor= from the request. Returns (None, None) when the client
+    asked for neither, so list endpoints keep returning the full result by default.
+    """
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    if limit is None and cursor is None:
+        return None, None
+    try:
+        limit = int(limit) if limit is not None else PAGE_DEFAULT_LIMIT
+    except ValueError:
+        raise PaginationError("Invalid limit")
+    return min(max(limit, 1), PAGE_MAX_LIMIT), cursor or None
+
+
+def keyset_paginate(query, columns, key_fn, descending=True):
+    """
+    Cursor (keyset) pagination over a stable sort key such as (timestamp, id).
+    The last column must be unique. key_fn(row) returns the row's values for `columns`.
+    Returns (rows, page_meta); page_meta is {} when the client did not ask to paginate.
+    """
+    order = [c.desc() if descending else c.asc() for c in columns]
+    limit, cursor = get_page_args()
+    if limit is None:
+        return query.order_by(*order).all(), {}
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        clauses = []
+        for i, col in enumerate(columns):
+            cmp = col < values[i] if descending else col > values[i]
+            clauses.append(and_(*[columns[j] == values[j] for j in range(i)], cmp))
+        query = query.filter(or_(*clauses))
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(key_fn(rows[-1])) if has_more and rows else None
+    return rows, {"next_cursor": next_cursor, "limit": limit}
+
+
+# -------------------- DB PORTABILITY --------------------
+
+UPSERT_DIALECTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def stream_query(query, batch_size=None):
+    """
+    Iterates a query without materialising it. On PostgreSQL yield_per opens a named
+    server-side cursor, so exports hold one batch in memory instead of the whole table.
+    """
+    return query.execution_options(yield_per=batch_size or DB_STREAM_BATCH_SIZE)
+
+
+def upsert(model, rows, conflict_cols, update_cols):
+    """
+    INSERT ... ON CONFLICT (conflict_cols) DO UPDATE for a batch of column dicts; with no
+    update_cols existing rows are left alone (DO NOTHING). conflict_cols must match a unique
+    constraint. Falls back to lookup-then-write on other backends.
+    """
+    # A single statement may not touch the same row twice; last write per key wins
+    rows = list({tuple(r[c] for c in conflict_cols): r for r in rows}.values())
+    if not rows:
+        return
+    insert_fn = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if insert_fn is None:
+        for values in rows:
+            existing = model.query.filter_by(**{c: values[c] for c in conflict_cols}).first()
+            if existing:
+                for c in update_cols:
+                    setattr(existing, c, values[c])
+            else:
+                db.session.add(model(**values))
+        return
+    stmt = insert_fn(model.__table__).values(rows)
+    if update_cols:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_cols,
+            set_={c: stmt.excluded[c] for c in update_cols},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_cols)
+    db.session.execute(stmt)
+
+
 # -------------------- DB MODELS --------------------
 
 # --- NEW HOSTEL DB MODELS ---
@@ -442,8 +1889,12 @@ class User(db.Model):
     status = db.Column(db.String(20), default="PENDING")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     emp_id = db.Column(db.String(100), unique=True, nullable=True)
+    parent_alert_mode = db.Column(db.String(20), nullable=True) # None/"digest" or "immediate" absence emails to parent
     parent_email = db.Column(db.String(200), nullable=True)
     parent_password_hash = db.Column(db.String(256), nullable=True)
+    __table_args__ = (
+        db.Index("ix_user_role_class_status", "role", "degree", "semester", "section", "status"),
+    )
 
 
 class Note(db.Model):
@@ -457,6 +1908,9 @@ class Note(db.Model):
     file_path = db.Column(db.String(500))
     uploaded_by = db.Column(db.Integer, db.ForeignKey("user.id"))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index("ix_note_class_timestamp", "degree", "semester", "section", "timestamp"),
+    )
 
 
 class Notice(db.Model):
@@ -474,6 +1928,49 @@ class Notice(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class FeedNotification(db.Model):
+    """One in-app notification, stored once however many students it reaches."""
+    __tablename__ = "feed_notifications"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False) # notice, note, fee, marks, ...
+    title = db.Column(db.String(300), nullable=False)
+    body = db.Column(db.Text)
+    ref_type = db.Column(db.String(30)) # table the notification points at, e.g. "notice"
+    ref_id = db.Column(db.String(64))
+    created_by = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class FeedAudience(db.Model):
+    """
+    Who a notification is for: a class descriptor (NULL degree/semester/section = any)
+    or one explicit student. Resolved against the reader at read time.
+    """
+    __tablename__ = "feed_audience"
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey("feed_notifications.id", ondelete="CASCADE"), nullable=False)
+    degree = db.Column(db.String(50))
+    semester = db.Column(db.Integer)
+    section = db.Column(db.String(50)) # stored upper-cased
+    student_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    __table_args__ = (
+        db.Index("ix_feed_audience_class", "degree", "semester", "section", "notification_id"),
+        db.Index("ix_feed_audience_student", "student_id", "notification_id"),
+    )
+
+
+class FeedReadState(db.Model):
+    """
+    Per-user read watermark: every notification with id <= last_read_id counts as read.
+    Parent tokens carry the student's id, so the role keeps the two watermarks apart.
+    """
+    __tablename__ = "feed_read_state"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    last_read_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Book(db.Model):
     __tablename__ = "books"
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -487,6 +1984,33 @@ class Book(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class PendingUpload(db.Model):
+    """A presigned browser upload; consumed once by the create endpoint for its purpose."""
+    __tablename__ = "pending_uploads"
+    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    object_key = db.Column(db.String(500), unique=True, nullable=False)
+    purpose = db.Column(db.String(20), nullable=False) # note | book | notice | resume
+    owner_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    filename = db.Column(db.String(300))
+    content_type = db.Column(db.String(200))
+    max_bytes = db.Column(db.BigInteger, nullable=False)
+    size_bytes = db.Column(db.BigInteger, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+
+class StoredObject(db.Model):
+    """A content-addressed object in storage, shared by every Note/Book/Notice row that points at its key."""
+    __tablename__ = "stored_objects"
+    key = db.Column(db.String(500), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(200))
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class HostelComplaint(db.Model):
     __tablename__ = "hostel_complaints"
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -523,6 +2047,9 @@ class FeeTarget(db.Model):
     status = db.Column(db.String(20), default="pending")
     paid_at = db.Column(db.DateTime, nullable=True)
     order_id = db.Column(db.String, nullable=True)
+    __table_args__ = (
+        db.Index("ix_fee_targets_student", "student_id"),
+    )
 
 
 class Order(db.Model):
@@ -566,6 +2093,9 @@ class Mark(db.Model):
     max_marks = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     uploaded_by = db.Column(db.Integer, db.ForeignKey("user.id"))
+    __table_args__ = (
+        db.Index("ix_marks_student_created", "student_id", "created_at"),
+    )
 
 
 class Feedback(db.Model):
@@ -606,6 +2136,25 @@ class Attendance(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow) # For 30 min edit window check
     __table_args__ = (
         db.UniqueConstraint("student_id", "subject", "date", name="_student_subject_date_uc"),
+        db.Index("ix_attendance_student_date", "student_id", "date"),
+        db.Index("ix_attendance_subject_date", "subject", "date"),
+    )
+
+
+class AbsenceAlert(db.Model):
+    """An Absent mark waiting to go out in the student's next absence digest."""
+    __tablename__ = "absence_alerts"
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    digested_at = db.Column(db.DateTime) # set when claimed into a digest
+    digest_token = db.Column(db.String(32))
+    __table_args__ = (
+        db.UniqueConstraint("student_id", "subject", "date", name="uq_absence_alert"),
+        db.Index("ix_absence_alerts_pending", "digested_at", "student_id"),
+        db.Index("ix_absence_alerts_token", "digest_token"),
     )
 
 # --- NEW PERSONAL ATTENDANCE MODELS ---
@@ -643,6 +2192,31 @@ class Message(db.Model):
     body = db.Column(db.Text)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index("ix_messages_faculty_created", "faculty_id", "created_at"),
+    )
+
+
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(300), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    text_body = db.Column(db.Text) # plain-text alternative part
+    category = db.Column(db.String(50)) # note, notice, fee, marks, attendance, ...
+    status = db.Column(db.String(20), nullable=False, default="pending") # pending, sending, sent, failed, skipped
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+        db.Index("ix_email_outbox_claimed_by", "claimed_by"),
+    )
 
 
 # ==================== HRD (PLACEMENT CELL) MODELS ====================
@@ -693,7 +2267,9 @@ class StudentPlacementProfile(db.Model):
     __tablename__ = "student_placement_profiles"
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), unique=True, nullable=False)
-    resume_url = db.Column(db.String(500), nullable=True)
+    resume_url = db.Column(db.String(500), nullable=True) # external link only; uploaded resumes use resume_key
+    resume_key = db.Column(db.String(500), nullable=True)
+    resume_etag = db.Column(db.String(100), nullable=True)
     skills = db.Column(db.JSON, default=[])
     certifications = db.Column(db.JSON, default=[])
     projects = db.Column(db.JSON, default=[])
@@ -716,6 +2292,7 @@ class DriveApplication(db.Model):
     tags = db.Column(db.JSON, default=[])
     __table_args__ = (
         db.UniqueConstraint("drive_id", "student_id", name="uq_drive_application"),
+        db.Index("ix_drive_applications_student", "student_id"),
     )
 
 class InterviewRound(db.Model):
@@ -772,6 +2349,15 @@ class AIAnalysisCache(db.Model):
     ats_score = db.Column(db.Integer, default=0)
     analyzed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class AIResponseCache(db.Model):
+    """Persisted Groq answers (AI_CACHE_PERSIST=1); see GroqResponseCache."""
+    __tablename__ = "ai_response_cache"
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of model, temperature, json_mode and messages
+    model = db.Column(db.String(80), nullable=False)
+    response = db.Column(db.Text, nullable=False)  # JSON-encoded answer (text, or the parsed object in json_mode)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class PlacementActivityLog(db.Model):
     __tablename__ = "placement_activity_logs"
     id = db.Column(db.Integer, primary_key=True)
@@ -830,11 +2416,61 @@ class HRDAttendance(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     __table_args__ = (
         db.UniqueConstraint("student_id", "hrd_subject_id", "date", name="_hrd_att_uc"),
+        db.Index("ix_hrd_attendance_student_date", "student_id", "date"),
     )
 
 # --- END NEW HRD MODELS ---
 
 
+# -------------------- IDENTITY --------------------
+
+# Per-process LRU of user snapshots; short TTL bounds staleness across workers
+user_cache = LocalCacheBackend(max_entries=USER_CACHE_MAX_ENTRIES)
+USER_SNAPSHOT_EXCLUDED = {"password_hash", "parent_password_hash"}
+
+
+def _user_snapshot(row, **extra):
+    """Detached, read-only copy of a user row (credentials excluded) that is safe to cache."""
+    data = {c.name: getattr(row, c.name) for c in row.__table__.columns if c.name not in USER_SNAPSHOT_EXCLUDED}
+    data.update(extra)
+    return SimpleNamespace(**data)
+
+
+def load_user_snapshot(user_id, hrd=False):
+    key = f"{'hrd_user' if hrd else 'user'}:{user_id}"
+    snapshot = user_cache.get(key)
+    if snapshot is None:
+        if hrd:
+            row = HRDUser.query.get(user_id)
+            snapshot = _user_snapshot(row, role="chro") if row else None
+        else:
+            row = User.query.get(user_id)
+            snapshot = _user_snapshot(row) if row else None
+        if snapshot is not None:
+            user_cache.set(key, snapshot, ttl=USER_CACHE_TTL)
+    return snapshot
+
+
+def invalidate_user_cache(user_id, hrd=False):
+    user_cache.delete(f"{'hrd_user' if hrd else 'user'}:{user_id}")
+
+
+@jwt.user_lookup_loader
+def _lookup_current_user(jwt_header, jwt_data):
+    """
+    Resolves the token's identity once per request; handlers read it via get_current_user().
+    CHRO tokens carry an HRDUser id, every other role a User id (parents use the ward's id).
+    """
+    if "current_user" not in g:
+        g.current_user = load_user_snapshot(jwt_data["sub"], hrd=jwt_data.get("role") == "chro")
+    return g.current_user
+
+
+@jwt.user_lookup_error_loader
+def _current_user_not_found(jwt_header, jwt_data):
+    return jsonify({"success": False, "message": "Invalid token or user not found"}), 401
+
+
 def roles_allowed(roles):
     def decorator(fn):
         @wraps(fn)
@@ -896,15 +2532,757 @@ def admin_only(fn):
     return wrapper
 
 
+# -------------------- EMAIL OUTBOX --------------------
+
+EMAIL_OUTBOX_STATUSES = ["pending", "sending", "sent", "failed", "skipped"]
+
+
+def queue_email(to_email, subject, body, category=None, text_body=None):
+    """
+    Adds an email to the outbox inside the caller's transaction. Nothing is sent unless
+    the caller commits; workers pick it up right after the commit.
+    """
+    if not to_email:
+        return None
+    row = EmailOutbox(to_email=to_email, subject=subject, body=body, text_body=text_body, category=category)
+    db.session.add(row)
+    db.session.info["outbox_queued"] = True
+    return row
+
+
+def queue_professional_email(to_email, subject, title, details, main_body, category=None):
+    """Queues a professionally styled HTML email (see render_professional_email)."""
+    if not to_email:
+        return None
+    html, text_body = render_professional_email(title, details, main_body)
+    return queue_email(to_email, subject, html, category, text_body)
+
+
+def queue_emails(rows):
+    """
+    Bulk form of queue_email for class-wide fan-outs: one executemany INSERT instead of a
+    flushed row per recipient. Each row is a dict of to_email, subject, body and optionally
+    category / text_body; rows without an address are dropped. Returns the number queued.
+    """
+    rows = [{"to_email": r["to_email"], "subject": r["subject"], "body": r["body"],
+             "category": r.get("category"), "text_body": r.get("text_body")} for r in rows if r.get("to_email")]
+    if not rows:
+        return 0
+    db.session.execute(db.insert(EmailOutbox), rows)
+    db.session.info["outbox_queued"] = True
+    return len(rows)
+
+
+@event.listens_for(db.session, "after_commit")
+def _wake_outbox_workers(session):
+    if session.info.pop("outbox_queued", False):
+        email_workers.wake()
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _discard_outbox_flag(session, previous_transaction):
+    session.info.pop("outbox_queued", None)
+
+
+def _claimable_outbox_filter(now):
+    return or_(
+        and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == "sending", EmailOutbox.claimed_at < now - timedelta(seconds=EMAIL_CLAIM_TIMEOUT)),
+    )
+
+
+def claim_outbox_batch(limit):
+    """
+    Marks up to `limit` due messages as sending for this caller. The UPDATE re-checks the
+    claim condition, so concurrent workers (threads or processes) never get the same row.
+    """
+    now = datetime.utcnow()
+    ids = [r.id for r in db.session.query(EmailOutbox.id).filter(_claimable_outbox_filter(now)).
+           order_by(EmailOutbox.id).limit(limit)]
+    if not ids:
+        db.session.rollback()
+        return []
+    token = uuid.uuid4().hex
+    EmailOutbox.query.filter(EmailOutbox.id.in_(ids), _claimable_outbox_filter(now)).update(
+        {"status": "sending", "claimed_by": token, "claimed_at": now}, synchronize_session=False
+    )
+    db.session.commit()
+    return EmailOutbox.query.filter_by(claimed_by=token).order_by(EmailOutbox.id).all()
+
+
+def drain_outbox(limit=None):
+    """Sends one claimed batch and records each message's outcome. Returns the batch size."""
+    batch = claim_outbox_batch(limit or EMAIL_BATCH_SIZE)
+    if not batch:
+        return 0
+    if not smtp_configured():
+        for msg in batch:
+            msg.attempts += 1; msg.claimed_by = None
+            msg.status = "skipped"; msg.last_error = "SMTP not configured"
+        db.session.commit()
+        return len(batch)
+
+    # The whole batch goes over one pooled session
+    with ExitStack() as stack:
+        try:
+            smtp = stack.enter_context(smtp_pool.session())
+        except SMTPPoolExhausted:
+            # Hand the batch back now instead of leaving it "sending" until EMAIL_CLAIM_TIMEOUT
+            for msg in batch:
+                msg.status = "pending"; msg.claimed_by = None
+            db.session.commit()
+            print(f"[outbox] no SMTP slot free; released {len(batch)} message(s)")
+            return 0
+        for msg in batch:
+            msg.attempts += 1
+            msg.claimed_by = None
+            try:
+                smtp.send(msg.to_email, msg.subject, msg.body, msg.text_body)
+                msg.status = "sent"; msg.sent_at = datetime.utcnow(); msg.last_error = None
+            except Exception as e:
+                msg.last_error = str(e)[:1000]
+                if msg.attempts >= EMAIL_MAX_ATTEMPTS:
+                    msg.status = "failed"
+                else:
+                    msg.status = "pending"
+                    msg.next_attempt_at = datetime.utcnow() + timedelta(seconds=EMAIL_RETRY_BACKOFF * 2 ** (msg.attempts - 1))
+                print(f"[outbox] message {msg.id} to {msg.to_email} failed (attempt {msg.attempts}): {e}")
+            db.session.commit()
+    return len(batch)
+
+
+class EmailWorkerPool:
+    """Background threads that drain the outbox; woken on commit, otherwise polling."""
+
+    def __init__(self, size):
+        self.size = size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def start(self):
+        # Threads do not survive fork; gunicorn workers call this again in post_fork
+        if self.size <= 0 or (self._pid == os.getpid() and self._threads):
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+            for i in range(self.size)
+        ]
+        for t in self._threads:
+            t.start()
+        print(f"[outbox] started {self.size} email worker(s) in pid {self._pid}")
+
+    def stop(self, timeout=10):
+        self._stop.set(); self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            sent = 0
+            try:
+                with app.app_context():
+                    sent = drain_outbox()
+            except Exception as e:
+                print(f"[outbox] worker error: {e}")
+            if not sent:
+                self._wake.wait(EMAIL_POLL_INTERVAL)
+                self._wake.clear()
+
+
+email_workers = EmailWorkerPool(EMAIL_WORKERS)
+
+
+class PeriodicTask:
+    """Runs fn() inside an app context every `interval` seconds on a daemon thread (one per process)."""
+
+    def __init__(self, name, fn, interval):
+        self.name, self.fn, self.interval = name, fn, interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if self.interval <= 0 or (self._pid == os.getpid() and self._thread):
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with app.app_context():
+                    self.fn()
+            except Exception as e:
+                print(f"[{self.name}] error: {e}")
+
+
+# -------------------- NOTIFICATION FEED --------------------
+
+def class_audience(degree=None, semester=None, sections=None):
+    """Audience descriptors for a class; sections may be a list or a comma-separated string."""
+    if isinstance(sections, str):
+        sections = sections.split(",")
+    sections = sorted({s.strip().upper() for s in (sections or []) if s and s.strip()})
+    semester = int(semester) if semester not in (None, "") else None
+    return [{"degree": degree or None, "semester": semester, "section": sec} for sec in sections or [None]]
+
+
+def student_audience(student_ids):
+    return [{"student_id": sid} for sid in dict.fromkeys(student_ids)]
+
+
+def publish_notification(kind, title, audience, body=None, ref_type=None, ref_id=None, created_by=None):
+    """
+    Adds a feed notification and its audience rows to the caller's transaction.
+    A class-wide broadcast costs one notification row plus one row per section.
+    """
+    if not audience:
+        return None
+    n = FeedNotification(kind=kind, title=title, body=body, ref_type=ref_type,
+                         ref_id=str(ref_id) if ref_id is not None else None, created_by=created_by)
+    db.session.add(n); db.session.flush()
+    db.session.execute(FeedAudience.__table__.insert(), [
+        {"notification_id": n.id, "degree": None, "semester": None, "section": None, "student_id": None, **a}
+        for a in audience
+    ])
+    return n
+
+
+def feed_query_for(student):
+    """Notification ids addressed to this student, via the indexed audience table."""
+    section = student.section.strip().upper() if student.section else None
+    class_match = and_(
+        FeedAudience.student_id.is_(None),
+        or_(FeedAudience.degree.is_(None), FeedAudience.degree == student.degree),
+        or_(FeedAudience.semester.is_(None), FeedAudience.semester == student.semester),
+        or_(FeedAudience.section.is_(None), FeedAudience.section == section),
+    )
+    return db.session.query(FeedAudience.notification_id).filter(
+        or_(FeedAudience.student_id == student.id, class_match)
+    )
+
+
+# -------------------- DIRECT UPLOADS --------------------
+
+# purpose -> (key prefix, roles allowed to request it; None = any signed-in user)
+DIRECT_UPLOAD_PURPOSES = {
+    "note": ("notes/", {"professor", "admin"}),
+    "book": ("books/", {"admin"}),
+    "notice": ("notices/", {"professor", "admin"}),
+    "resume": ("resumes/", None),
+}
+
+
+class DirectUploadError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@app.errorhandler(DirectUploadError)
+def handle_direct_upload_error(e):
+    return jsonify({"success": False, "message": str(e)}), e.status
+
+
+def new_object_key(prefix, filename, owner_id=None):
+    ext = filename.rsplit(".", 1)[1].lower()
+    if prefix == "resumes/":
+        return f"resumes/student_{owner_id}_{uuid.uuid4().hex[:8]}.{ext}"
+    return f"{prefix}{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}.{ext}"
+
+
+def create_direct_upload(purpose, owner_id, filename, content_type, size=None):
+    """
+    Records a PendingUpload and returns it with a presigned POST that only accepts
+    this key, this content type and at most DIRECT_UPLOAD_MAX_BYTES.
+    """
+    if not allowed_file(filename or ""):
+        raise DirectUploadError("File type not allowed")
+    if size is not None and not 0 < size <= DIRECT_UPLOAD_MAX_BYTES:
+        raise DirectUploadError(f"File must be between 1 byte and {DIRECT_UPLOAD_MAX_BYTES} bytes", 413)
+    content_type = content_type or "application/octet-stream"
+    key = new_object_key(DIRECT_UPLOAD_PURPOSES[purpose][0], filename, owner_id)
+
+    storage.ensure_bucket()
+    post = storage.presign_post(key, content_type, DIRECT_UPLOAD_MAX_BYTES, DIRECT_UPLOAD_EXPIRES)
+    pending = PendingUpload(
+        object_key=key, purpose=purpose, owner_id=owner_id, filename=filename[:300],
+        content_type=content_type, max_bytes=DIRECT_UPLOAD_MAX_BYTES,
+        expires_at=datetime.utcnow() + timedelta(seconds=DIRECT_UPLOAD_EXPIRES),
+    )
+    db.session.add(pending)
+    return pending, post
+
+
+def complete_direct_upload(upload_id, purpose):
+    """
+    Finalize step: checks with a HEAD that the caller's upload landed in storage,
+    claims it (committed with the caller's record) and returns the object key.
+    """
+    pending = db.session.get(PendingUpload, upload_id)
+    if not pending or pending.purpose != purpose or pending.owner_id != int(get_jwt_identity()):
+        raise DirectUploadError("Unknown upload_id", 404)
+    if pending.completed_at:
+        raise DirectUploadError("Upload already used", 409)
+    head = storage.head(pending.object_key)
+    if head is None:
+        raise DirectUploadError("File has not been uploaded yet", 409)
+    if head["size"] > pending.max_bytes:
+        storage.delete(pending.object_key)
+        raise DirectUploadError("Uploaded file is too large", 413)
+    # Conditional claim: of two finalize calls racing on one upload_id only one updates the
+    # row, so the object is attached (and its reference counted) once
+    claimed = PendingUpload.query.filter(
+        PendingUpload.id == pending.id, PendingUpload.completed_at.is_(None)
+    ).update({"completed_at": datetime.utcnow(), "size_bytes": head["size"]}, synchronize_session="fetch")
+    if claimed != 1:
+        raise DirectUploadError("Upload already used", 409)
+    return pending.object_key
+
+
+# -------------------- CONTENT-ADDRESSED STORAGE --------------------
+
+def hash_stream(stream, chunk_size=1024 * 1024):
+    """
+    SHA-256 and length of the stream's remaining bytes. Returns (digest, size, stream) where
+    stream is rewound for upload; a non-seekable stream is spooled to a temp file as it is
+    hashed and the spool is returned instead.
+    """
+    digest = hashlib.sha256(); size = 0
+    seekable = stream.seekable() if hasattr(stream, "seekable") else False
+    start = stream.tell() if seekable else None
+    spool = None if seekable else tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, dir=TEMP_DIR)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk); size += len(chunk)
+        if spool is not None:
+            spool.write(chunk)
+    if spool is not None:
+        spool.seek(0)
+        return digest.hexdigest(), size, spool
+    stream.seek(start)
+    return digest.hexdigest(), size, stream
+
+
+def content_key(digest, filename):
+    ext = filename.rsplit(".", 1)[1].lower() if filename and "." in filename else "bin"
+    return f"cas/{digest[:2]}/{digest}.{ext}"
+
+
+def store_object(file_obj, filename, content_type="application/octet-stream"):
+    """
+    Stores an upload under a key derived from its SHA-256 and takes a reference on it in
+    the caller's transaction. Content that is already stored is not transferred again.
+    Returns the key to save on the Note/Book/Notice row.
+    """
+    digest, size, stream = hash_stream(getattr(file_obj, "stream", file_obj))
+    key = content_key(digest, filename)
+
+    # Take the reference first: insert-if-missing then increment. The UPDATE holds the row
+    # lock until commit, so a concurrent release_object cannot drop the last reference (and
+    # delete the object) between the count read below and this transaction's commit.
+    upsert(StoredObject, [{"key": key, "sha256": digest, "size_bytes": size,
+                           "content_type": content_type, "ref_count": 0}], ["key"], [])
+    StoredObject.query.filter_by(key=key).update({"ref_count": StoredObject.ref_count + 1})
+    ref_count = db.session.query(StoredObject.ref_count).filter_by(key=key).scalar()
+    if ref_count == 1:
+        # First reference, or the row was just recreated after its object was released
+        upload_to_minio(stream, key, content_type)
+    else:
+        upload_stats.record_dedup(size)
+    return key
+
+
+def release_object(key):
+    """
+    Drops one reference to a stored key. The object is deleted from storage after commit
+    once nothing points at it; keys from before content addressing have no StoredObject
+    row and belong to a single record, so they are always deleted.
+    """
+    if not key:
+        return
+    if db.session.get(StoredObject, key) is not None:
+        StoredObject.query.filter_by(key=key).update({"ref_count": StoredObject.ref_count - 1})
+        if not StoredObject.query.filter(StoredObject.key == key, StoredObject.ref_count <= 0).delete():
+            return
+    db.session.info.setdefault("storage_deletes", []).append(key)
+
+
+@event.listens_for(db.session, "after_commit")
+def _delete_released_objects(session):
+    keys = session.info.pop("storage_deletes", [])
+    if not keys:
+        return
+    # An upload of the same content may have taken a new reference since the release
+    # committed; the session cannot emit SQL here, so check on a separate connection
+    try:
+        with db.engine.connect() as conn:
+            revived = set(conn.execute(db.select(StoredObject.key).where(StoredObject.key.in_(keys))).scalars())
+    except Exception as e:
+        print(f"Skipping storage deletes, reference check failed: {e}")
+        return
+    for key in keys:
+        if key in revived:
+            continue
+        # Best effort: a leftover object only costs space
+        try:
+            storage.delete(key)
+            presign_cache.invalidate(key)
+        except Exception as e:
+            print(f"Failed to delete object {key} from storage: {e}")
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _discard_released_objects(session, previous_transaction):
+    session.info.pop("storage_deletes", None)
+
+
+# -------------------- STORAGE GC --------------------
+
+# Columns holding storage keys, and columns holding URLs that may point into the bucket
+STORAGE_KEY_COLUMNS = [
+    Note.file_path, Book.file_path, Notice.attachment, HostelComplaint.attachment, Receipt.storage_key,
+    AIChatMessage.attachment, StudentPlacementProfile.resume_key, StoredObject.key,
+]
+STORAGE_URL_COLUMNS = [StudentPlacementProfile.resume_url, PlacementOffer.offer_letter_url, AIAnalysisCache.resume_url]
+
+
+def referenced_storage_keys():
+    """Every key some row still points at, including uploads that are issued but not yet finalized."""
+    keys = set()
+    for col in STORAGE_KEY_COLUMNS:
+        keys.update(k for (k,) in stream_query(db.session.query(col).filter(col.isnot(None))) if k)
+    for col in STORAGE_URL_COLUMNS:
+        urls = stream_query(db.session.query(col).filter(col.isnot(None)))
+        keys.update(filter(None, (object_key_from_url(u) for (u,) in urls)))
+    in_flight = db.session.query(PendingUpload.object_key).filter(PendingUpload.completed_at.is_(None))
+    keys.update(k for (k,) in in_flight)
+    return keys
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart (rate <= 0: unlimited)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+def collect_orphan_objects(dry_run=True, prefix="", min_age_hours=STORAGE_GC_MIN_AGE_HOURS,
+                           max_deletes=STORAGE_GC_MAX_DELETES, rate=STORAGE_GC_REQUESTS_PER_SEC):
+    """
+    Diffs the bucket listing (pages of 1000) against referenced_storage_keys() and deletes
+    unreferenced objects older than min_age_hours in delete_many batches of up to 1000.
+    The key set is read first, so anything uploaded during the run is too young to touch.
+    Returns a summary; dry_run only counts.
+    """
+    started = time.time()
+    referenced = referenced_storage_keys()
+    db.session.rollback()  # don't hold a read transaction open while listing
+    cutoff = datetime.utcnow() - timedelta(hours=min_age_hours)
+    limiter = RateLimiter(rate)
+    summary = {"dry_run": dry_run, "prefix": prefix, "referenced": len(referenced), "scanned": 0,
+               "orphans": 0, "orphan_bytes": 0, "deleted": 0, "errors": [], "sample": []}
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        if not dry_run:
+            limiter.wait()
+            failed = storage.delete_many(batch)
+            summary["errors"] += [f"{k}: {code}" for k, code in failed][:20]
+            summary["deleted"] += len(batch) - len(failed)
+            for k in batch:
+                presign_cache.invalidate(k)
+        batch.clear()
+
+    pages = storage.list_pages(prefix, page_size=1000)
+    while summary["orphans"] < max_deletes:
+        limiter.wait()
+        page = next(pages, None)
+        if page is None:
+            break
+        for obj in page:
+            summary["scanned"] += 1
+            if obj["key"] in referenced or obj["modified"].astimezone(timezone.utc).replace(tzinfo=None) > cutoff:
+                continue
+            summary["orphans"] += 1; summary["orphan_bytes"] += obj["size"]
+            if len(summary["sample"]) < 20:
+                summary["sample"].append(obj["key"])
+            batch.append(obj["key"])
+            if len(batch) == 1000:
+                flush()
+            if summary["orphans"] >= max_deletes:
+                break
+    flush()
+    summary["truncated"] = summary["orphans"] >= max_deletes
+    summary["elapsed_s"] = round(time.time() - started, 2)
+    return summary
+
+
+def storage_gc_run():
+    """Background entry point: one collector at a time across workers (file lock, plus advisory lock on PostgreSQL)."""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    with open(os.path.join(TEMP_DIR, "storage_gc.lock"), "w") as lock_file:
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+        conn = db.engine.connect() if db.engine.dialect.name == "postgresql" else None
+        try:
+            if conn is not None and not conn.exec_driver_sql(f"SELECT pg_try_advisory_lock({STORAGE_GC_LOCK_ID})").scalar():
+                return None
+            summary = collect_orphan_objects(dry_run=STORAGE_GC_DRY_RUN)
+            print(f"[storage-gc] {'would delete' if summary['dry_run'] else 'deleted'} "
+                  f"{summary['orphans'] if summary['dry_run'] else summary['deleted']} of {summary['scanned']} objects "
+                  f"({summary['orphan_bytes'] / 1048576:.1f} MB) in {summary['elapsed_s']}s")
+            return summary
+        finally:
+            if conn is not None:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({STORAGE_GC_LOCK_ID})")
+                conn.close()
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+storage_gc_task = PeriodicTask("storage-gc", storage_gc_run, STORAGE_GC_INTERVAL)
+
+
+# -------------------- ABSENCE ALERTS --------------------
+
+def notify_absences(students, subject, marked_date, absent_ids, present_ids):
+    """
+    Absence notifications for one attendance-marking batch (caller commits).
+    Digest mode buffers an AbsenceAlert per absence and only emails parents who opted into
+    immediate alerts; immediate mode emails student and parent per absence, as before.
+    Re-marking a student Present drops their not-yet-sent alert for that class.
+    """
+    date_str = marked_date.isoformat()
+    details = {"Subject": subject, "Date": date_str, "Status": "Absent"}
+    immediate = ABSENCE_ALERT_MODE == "immediate"
+    alerts = []
+    for sid in absent_ids:
+        stu = students.get(sid)
+        if not stu:
+            continue
+        if immediate:
+            # Notify Student
+            queue_professional_email(stu.email, f"Attendance Alert: Absent for {subject}", "Absence Recorded", details, f"You have been marked <strong>Absent</strong> for {subject} on {date_str}.", category="attendance")
+        else:
+            alerts.append({"student_id": sid, "subject": subject, "date": marked_date, "created_at": datetime.utcnow()})
+        # Notify Parent
+        if stu.parent_email and (immediate or stu.parent_alert_mode == "immediate"):
+            queue_professional_email(stu.parent_email, f"Attendance Alert: {stu.name} Absent", f"Absence Alert for {stu.name}", details, f"Your ward <strong>{stu.name}</strong> was marked Absent for {subject} on {date_str}.", category="attendance")
+    if alerts:
+        upsert(AbsenceAlert, alerts, ["student_id", "subject", "date"], [])
+    if present_ids:
+        AbsenceAlert.query.filter(
+            AbsenceAlert.student_id.in_(present_ids), AbsenceAlert.subject == subject,
+            AbsenceAlert.date == marked_date, AbsenceAlert.digested_at.is_(None),
+        ).delete(synchronize_session=False)
+
+
+def flush_absence_digests(now=None):
+    """
+    Sends one digest per student whose oldest buffered absence is ABSENCE_DIGEST_HOURS old.
+    Alerts are claimed with a conditional UPDATE and the digests queued in the same
+    transaction, so concurrent flushers never send the same absence twice.
+    Returns the number of students digested.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=ABSENCE_DIGEST_HOURS)
+    due = db.session.query(AbsenceAlert.student_id).filter(AbsenceAlert.digested_at.is_(None)).\
+        group_by(AbsenceAlert.student_id).having(func.min(AbsenceAlert.created_at) <= cutoff)
+    token = uuid.uuid4().hex
+    claimed = AbsenceAlert.query.filter(
+        AbsenceAlert.student_id.in_(due.scalar_subquery()), AbsenceAlert.digested_at.is_(None)
+    ).update({"digested_at": now, "digest_token": token}, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return 0
+
+    by_student = {}
+    for a in AbsenceAlert.query.filter_by(digest_token=token).order_by(AbsenceAlert.date, AbsenceAlert.subject):
+        by_student.setdefault(a.student_id, {}).setdefault(a.date.isoformat(), []).append(a.subject)
+    students = User.query.filter(User.id.in_(list(by_student))).all()
+    for stu in students:
+        days = by_student[stu.id]
+        total = sum(len(subjects) for subjects in days.values())
+        details = {day: ", ".join(subjects) for day, subjects in days.items()}
+        queue_professional_email(
+            stu.email, f"Attendance Summary: {total} absence(s)", "Absence Summary", details,
+            f"You were marked <strong>Absent</strong> for {total} class(es) since your last summary.",
+            category="attendance_digest"
+        )
+        if stu.parent_email and stu.parent_alert_mode != "immediate":
+            queue_professional_email(
+                stu.parent_email, f"Attendance Summary: {stu.name}", f"Absence Summary for {stu.name}", details,
+                f"Your ward <strong>{stu.name}</strong> was marked Absent for {total} class(es) since the last summary.",
+                category="attendance_digest"
+            )
+    db.session.commit()
+    print(f"[absence] queued digests for {len(students)} student(s) covering {claimed} absence(s)")
+    return len(students)
+
+
+absence_digest_task = PeriodicTask("absence-digest", flush_absence_digests, ABSENCE_DIGEST_CHECK_INTERVAL)
+
+
+def start_background_workers():
+    """Per-process background threads: outbox senders, the absence digest scheduler, storage GC and AI cache cleanup."""
+    email_workers.start()
+    if ABSENCE_ALERT_MODE == "digest":
+        absence_digest_task.start()
+    storage_gc_task.start()
+    if AI_CACHE_PERSIST:
+        ai_cache_purge_task.start()
+
+
 # ==================== GROQ AI INTEGRATION FOR HRD ====================
 
-def groq_ai_call(messages, temperature=0.7, json_mode=False):
-    """Make a request to Groq AI API using llama-3.3-70b-versatile model."""
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+class GroqResponseCache:
+    """
+    Groq answers keyed by model, temperature, json_mode and a hash of the messages with
+    whitespace collapsed, so a prompt re-rendered from unchanged data is answered without a
+    call. Entries sit in an in-process LRU of max_entries; with persist they are also written
+    to ai_response_cache on their own connection (never committing the caller's session).
+    Values are stored JSON-encoded, so callers can mutate what they get back.
+    """
+
+    def __init__(self, max_entries=AI_CACHE_MAX_ENTRIES, persist=AI_CACHE_PERSIST):
+        self.persist = persist
+        self._cache = LocalCacheBackend(max_entries=max_entries)
+        self._lock = threading.Lock()
+        self.hits = self.db_hits = self.misses = self.stores = self.errors = 0
+
+    @staticmethod
+    def key(model, messages, temperature=None, json_mode=False):
+        def normalise(content):
+            return " ".join(content.split()) if isinstance(content, str) else content
+        blob = json.dumps({
+            "model": model, "temperature": temperature, "json_mode": bool(json_mode),
+            "messages": [{"role": m.get("role"), "content": normalise(m.get("content"))} for m in messages],
+        }, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        raw = self._cache.get(key)
+        if raw is not None:
+            self._count("hits")
+            return json.loads(raw)
+        if self.persist:
+            try:
+                with db.engine.connect() as conn:
+                    row = conn.execute(
+                        db.select(AIResponseCache.response, AIResponseCache.expires_at)
+                        .where(AIResponseCache.key == key, AIResponseCache.expires_at > datetime.utcnow())
+                    ).first()
+            except Exception as e:
+                self._count("errors")
+                print(f"AI cache read failed: {e}")
+                row = None
+            if row is not None:
+                self._count("db_hits")
+                self._cache.set(key, row.response, ttl=max((row.expires_at - datetime.utcnow()).total_seconds(), 1))
+                return json.loads(row.response)
+        self._count("misses")
+        return None
+
+    def set(self, key, model, value, ttl):
+        raw = json.dumps(value)
+        self._cache.set(key, raw, ttl=ttl)
+        self._count("stores")
+        if not self.persist:
+            return
+        now = datetime.utcnow()
+        row = {"key": key, "model": model, "response": raw, "created_at": now, "expires_at": now + timedelta(seconds=ttl)}
+        try:
+            with db.engine.begin() as conn:
+                insert_fn = UPSERT_DIALECTS.get(conn.dialect.name)
+                if insert_fn is None:
+                    conn.execute(AIResponseCache.__table__.delete().where(AIResponseCache.key == key))
+                    conn.execute(AIResponseCache.__table__.insert().values(row))
+                else:
+                    stmt = insert_fn(AIResponseCache.__table__).values(row)
+                    conn.execute(stmt.on_conflict_do_update(
+                        index_elements=["key"], set_={c: stmt.excluded[c] for c in ("model", "response", "created_at", "expires_at")},
+                    ))
+        except Exception as e:
+            # Best effort: the answer is still cached in this process
+            self._count("errors")
+            print(f"AI cache write failed: {e}")
+
+    def purge_expired(self):
+        deleted = AIResponseCache.query.filter(AIResponseCache.expires_at <= datetime.utcnow()).delete()
+        db.session.commit()
+        if deleted:
+            print(f"[ai-cache] purged {deleted} expired response(s)")
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            hits, db_hits, misses, stores, errors = self.hits, self.db_hits, self.misses, self.stores, self.errors
+        lookups = hits + db_hits + misses
+        return {
+            "hits": hits, "db_hits": db_hits, "misses": misses, "stores": stores, "errors": errors,
+            "hit_rate": round((hits + db_hits) / lookups, 4) if lookups else None,
+            "entries": len(self._cache), "max_entries": self._cache.max_entries, "persist": self.persist,
+        }
+
+
+groq_cache = GroqResponseCache()
+ai_cache_purge_task = PeriodicTask("ai-cache-purge", groq_cache.purge_expired, AI_CACHE_PURGE_INTERVAL)
+
+
+def groq_ai_call(messages, temperature=0.7, json_mode=False, cache_ttl=0):
+    """
+    Make a request to Groq AI API using llama-3.3-70b-versatile model. With cache_ttl > 0 an
+    identical earlier answer is reused for that many seconds; errors are never cached.
+    """
     if not GROQ_API_KEY:
         return {"error": "GROQ_API_KEY not configured"}
+
+    cache_key = groq_cache.key(GROQ_MODEL, messages, temperature, json_mode) if cache_ttl > 0 else None
+    if cache_key:
+        cached = groq_cache.get(cache_key)
+        if cached is not None:
+            return cached
     
     payload = {
-        "model": "llama-3.3-70b-versatile",
+        "model": GROQ_MODEL,
         "messages": messages,
         "temperature": temperature,
         "max_tokens": 2048
@@ -929,10 +3307,12 @@ def groq_ai_call(messages, temperature=0.7, json_mode=False):
             try:
                 # Remove code blocks if present
                 clean_content = content.replace("```json", "").replace("```", "").strip()
-                return json.loads(clean_content)
+                content = json.loads(clean_content)
             except Exception as je:
                 print(f"JSON Parse Error: {je} | Raw: {content}")
                 return {"error": "Failed to parse AI JSON", "raw": content}
+        if cache_key:
+            groq_cache.set(cache_key, GROQ_MODEL, content, cache_ttl)
         return content
     except Exception as e:
         print(f"Groq API Error: {e}")
@@ -1057,12 +3437,12 @@ def hrd_required(allow_trainer=False):
                 
                 # 1. Check CHRO (HRDUser table)
                 if role == "chro":
-                    if HRDUser.query.get(identity):
+                    if get_current_user():
                         return fn(*args, **kwargs)
                 
                 # 2. Check Trainer (User table)
                 if allow_trainer and role in ["trainer", "hrd_trainer"]:
-                    t_user = User.query.get(identity)
+                    t_user = get_current_user()
                     if t_user and t_user.role in ["trainer", "hrd_trainer"]:
                         return fn(*args, **kwargs)
                 
@@ -1302,6 +3682,7 @@ def reset_password_endpoint():
         user.password_hash = hash_password(new_password)
         
     db.session.commit()
+    invalidate_user_cache(user.id)
 
     # Clear OTP
     db.session.delete(otp_record)
@@ -1447,8 +3828,7 @@ def login():
 @app.route("/me", methods=["GET"])
 @jwt_required()
 def me():
-    identity = get_jwt_identity()
-    user = User.query.get(identity)
+    user = get_current_user()
     return jsonify({
         "id": user.id, "name": user.name, "email": user.email,
         "role": user.role, "degree": user.degree, "semester": user.semester,
@@ -1484,7 +3864,6 @@ def approve_student():
     if not s:
         return jsonify({"success": False, "message": "Student not found"}), 404
     s.status = "APPROVED" if action == "approve" else "REJECTED"
-    db.session.commit()
     try:
         if action == "approve":
             subject = "NoteOrbit - Account Approved"
@@ -1497,7 +3876,7 @@ def approve_student():
                 "Semester": str(s.semester) if s.semester else "N/A",
                 "Status": "Approved"
             }
-            send_professional_email(s.email, subject, title, details, main_body)
+            queue_professional_email(s.email, subject, title, details, main_body, category="approval")
         
         elif action == "reject":
             subject = "NoteOrbit - Account Rejected"
@@ -1508,14 +3887,16 @@ def approve_student():
                 "SRN": s.srn or "N/A",
                 "Status": "Rejected"
             }
-            send_professional_email(s.email, subject, title, details, main_body)
+            queue_professional_email(s.email, subject, title, details, main_body, category="approval")
             
     except Exception as e:
-        print(f"Error sending approval/rejection email: {e}")
+        print(f"Error queueing approval/rejection email: {e}")
         # Build success message even if email fails, but maybe note it? 
         # For now keeping it simple as per request.
+    db.session.commit()
+    invalidate_user_cache(s.id)
 
-    return jsonify({"success": True, "message": f"Student {action}d (Email notification sent)"})
+    return jsonify({"success": True, "message": f"Student {action}d (Email notification queued)"})
 
 
 @app.route("/admin/update-student", methods=["POST"])
@@ -1539,6 +3920,7 @@ def update_student():
     if "parent_email" in data: s.parent_email = data["parent_email"]
     
     db.session.commit()
+    invalidate_user_cache(s.id)
     return jsonify({"success": True, "message": "Student updated successfully"})
 
 
@@ -1561,6 +3943,7 @@ def generate_parent_password():
     raw_password = f"P{random.randint(10000, 99999)}!"
     s.parent_password_hash = hash_password(raw_password)
     db.session.commit()
+    invalidate_user_cache(s.id)
     
     # Send Email
     subject = f"NoteOrbit - Parent Portal Access for {s.name}"
@@ -1576,13 +3959,162 @@ def generate_parent_password():
     <p>Please login and change your password immediately.</p>
     <p><em>Access Link: <a href="http://localhost:5173/login">NoteOrbit Portal</a></em></p>
     """
-    
-    success = send_email(s.parent_email, subject, body)
-    
-    if success:
-        return jsonify({"success": True, "message": f"Password sent to {s.parent_email}", "password": raw_password}) # Return pwd for dev ease if smtp fails
-    else:
-        return jsonify({"success": False, "message": "Failed to send email", "password": raw_password}), 500
+    
+    success = send_email(s.parent_email, subject, body)
+    
+    if success:
+        return jsonify({"success": True, "message": f"Password sent to {s.parent_email}", "password": raw_password}) # Return pwd for dev ease if smtp fails
+    else:
+        return jsonify({"success": False, "message": "Failed to send email", "password": raw_password}), 500
+
+
+@app.route("/admin/email-outbox", methods=["GET"])
+@admin_only
+def list_email_outbox():
+    """Delivery state of queued emails. Filters: status, category, to. Paged with ?limit/&cursor."""
+    status = request.args.get("status")
+    if status and status not in EMAIL_OUTBOX_STATUSES:
+        return jsonify({"success": False, "message": f"status must be one of {EMAIL_OUTBOX_STATUSES}"}), 400
+    q = EmailOutbox.query
+    if status:
+        q = q.filter(EmailOutbox.status == status)
+    if request.args.get("category"):
+        q = q.filter(EmailOutbox.category == request.args["category"])
+    if request.args.get("to"):
+        q = q.filter(EmailOutbox.to_email == request.args["to"])
+
+    counts = dict(db.session.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+    rows, page = keyset_paginate(q, [EmailOutbox.id], lambda m: (m.id,))
+    return jsonify({"success": True, "counts": {st: counts.get(st, 0) for st in EMAIL_OUTBOX_STATUSES}, "messages": [{
+        "id": m.id, "to": m.to_email, "subject": m.subject, "category": m.category, "status": m.status,
+        "attempts": m.attempts, "last_error": m.last_error,
+        "created_at": m.created_at.isoformat() if m.created_at else None,
+        "sent_at": m.sent_at.isoformat() if m.sent_at else None,
+        "next_attempt_at": m.next_attempt_at.isoformat() if m.status == "pending" and m.next_attempt_at else None,
+    } for m in rows], **page})
+
+
+@app.route("/admin/email-templates/stats", methods=["GET"])
+@admin_only
+def email_template_stats():
+    """Render counts and timings per email template since process start."""
+    return jsonify({"success": True, "pid": os.getpid(), "templates": {
+        name: tpl.stats() for name, tpl in EMAIL_TEMPLATES.items()
+    }})
+
+
+@app.route("/admin/storage/presign-stats", methods=["GET"])
+@admin_only
+def presign_cache_stats():
+    """Presigned URL cache hit rate since process start."""
+    return jsonify({"success": True, "pid": os.getpid(), "presign_cache": presign_cache.stats()})
+
+
+@app.route("/admin/storage/gc", methods=["POST"])
+@admin_only
+def run_storage_gc():
+    """Runs the orphan collector now. Dry run unless {"dry_run": false} is sent."""
+    payload = request.json or {}
+    try:
+        max_deletes = int(payload.get("max_deletes", STORAGE_GC_MAX_DELETES))
+        min_age_hours = float(payload.get("min_age_hours", STORAGE_GC_MIN_AGE_HOURS))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "max_deletes and min_age_hours must be numbers"}), 400
+    summary = collect_orphan_objects(dry_run=payload.get("dry_run", True) is not False, prefix=payload.get("prefix") or "",
+                                     min_age_hours=min_age_hours, max_deletes=max_deletes)
+    return jsonify({"success": True, **summary})
+
+
+@app.route("/admin/storage/upload-stats", methods=["GET"])
+@admin_only
+def storage_upload_stats():
+    """Upload counts and throughput through upload_to_minio since process start."""
+    return jsonify({"success": True, "pid": os.getpid(), "uploads": upload_stats.stats()})
+
+
+@app.route("/admin/storage/cache-stats", methods=["GET"])
+@admin_only
+def storage_cache_stats():
+    """Storage backend in use and, when enabled, its disk cache hit rate since process start."""
+    cache = getattr(storage, "cache", None)
+    return jsonify({"success": True, "pid": os.getpid(), "backend": storage.name,
+                    "disk_cache": cache.stats() if cache else None})
+
+
+@app.route("/admin/ai/cache-stats", methods=["GET"])
+@admin_only
+def ai_cache_stats():
+    """Groq response cache hit rate since process start (db_hits: answers found in ai_response_cache)."""
+    return jsonify({"success": True, "pid": os.getpid(), "ai_cache": groq_cache.stats()})
+
+
+@app.route("/storage/objects/<path:key>", methods=["GET"])
+def serve_storage_object(key):
+    """
+    Target of signed_object_url(): objects in the local backend, or S3 objects read through
+    the disk cache. Honours a single byte range, as PDF viewers request.
+    """
+    expires = request.args.get("expires", type=int)
+    signature = request.args.get("signature", "")
+    if not expires or expires < time.time() or not hmac.compare_digest(signature, sign_storage_token("get", key, expires)):
+        return jsonify({"success": False, "message": "Link expired or invalid"}), 403
+
+    byte_range = None
+    if request.range and request.range.units == "bytes" and len(request.range.ranges) == 1:
+        start, stop = request.range.ranges[0]
+        if start >= 0:
+            byte_range = (start, None if stop is None else stop - 1)
+    try:
+        reader, info = storage.open(key, byte_range)
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "File not found"}), 404
+    except ValueError:
+        return Response(status=416)
+
+    def generate():
+        try:
+            for chunk in iter(lambda: reader.read(256 * 1024), b""):
+                yield chunk
+        finally:
+            reader.close()
+
+    headers = {"Content-Length": str(info["length"]), "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=300"}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {info['start']}-{info['start'] + info['length'] - 1}/{info['size']}"
+    return Response(generate(), status=206 if byte_range else 200, headers=headers,
+                    mimetype=info["content_type"] or guess_content_type(key), direct_passthrough=True)
+
+
+@app.route("/storage/uploads", methods=["POST"])
+def receive_storage_upload():
+    """Browser POST target of LocalStorageBackend.presign_post(), checked like an S3 POST policy."""
+    form = request.form
+    key, content_type = form.get("key", ""), form.get("Content-Type", "")
+    try:
+        max_bytes, expires = int(form.get("max_bytes", "")), int(form.get("expires", ""))
+    except ValueError:
+        return jsonify({"success": False, "message": "Malformed upload form"}), 400
+    expected = sign_storage_token("post", key, content_type, max_bytes, expires)
+    if expires < time.time() or not hmac.compare_digest(form.get("signature", ""), expected):
+        return jsonify({"success": False, "message": "Upload form expired or invalid"}), 403
+    file = request.files.get("file")
+    size = stream_size(file.stream) if file else None
+    if not size or size > max_bytes:
+        return jsonify({"success": False, "message": f"File must be between 1 byte and {max_bytes} bytes"}), 400
+    storage.put(file.stream, key, content_type)
+    return "", 204
+
+
+# Nullable columns are coalesced so they can take part in keyset comparisons
+STUDENT_DIRECTORY_SORT_FIELDS = {
+    "name": User.name,
+    "srn": func.coalesce(User.srn, ""),
+    "degree": func.coalesce(User.degree, ""),
+    "semester": func.coalesce(User.semester, 0),
+    "section": func.coalesce(User.section, ""),
+    "status": func.coalesce(User.status, ""),
+    "created_at": func.coalesce(User.created_at, datetime(1970, 1, 1)),
+}
 
 
 @app.route("/admin/students", methods=["GET"])
@@ -1592,43 +4124,57 @@ def get_students_list_filtered():
     degree = request.args.get("degree")
     semester = request.args.get("semester")
     section = request.args.get("section")
+    # Optional server-side sorting: sort, order; paginated like the other lists with ?limit/&cursor
+    sort = request.args.get("sort", "name")
+    order = request.args.get("order", "asc").lower()
+
+    sort_col = STUDENT_DIRECTORY_SORT_FIELDS.get(sort)
+    if sort_col is None or order not in ("asc", "desc"):
+        return jsonify({"success": False, "message": "Invalid sort parameters."}), 400
+
+    # Single outer-joined, column-projected query (hostel/room resolved in SQL, not per student)
+    q = db.session.query(
+        User.id, User.srn, User.name, User.email, User.degree, User.semester, User.section,
+        User.status, User.parent_email,
+        and_(User.parent_password_hash.isnot(None), User.parent_password_hash != "").label("parent_access"),
+        Hostel.name.label("hostel_name"), Room.room_number.label("room_number"),
+        sort_col.label("sort_value"),
+    ).outerjoin(HostelAllocation, HostelAllocation.student_id == User.id).\
+        outerjoin(Hostel, Hostel.id == HostelAllocation.hostel_id).\
+        outerjoin(Room, Room.id == HostelAllocation.room_id).\
+        filter(User.role == "student")
 
-    q = User.query.filter_by(role="student").order_by(User.name.asc())
-    
     if degree:
-        q = q.filter_by(degree=degree)
-    
+        q = q.filter(User.degree == degree)
+
     if semester:
         try:
-            q = q.filter_by(semester=int(semester))
+            q = q.filter(User.semester == int(semester))
         except ValueError:
             return jsonify({"success": False, "message": "Invalid semester parameter."}), 400
-            
+
     if section:
-        q = q.filter_by(section=section)
-        
-    students = q.all()
+        q = q.filter(User.section == section)
+
+    # User.id as tie-breaker keeps page boundaries stable
+    rows, meta = keyset_paginate(q, [sort_col, User.id], lambda r: (r.sort_value, r.id), descending=(order == "desc"))
+
     out = []
-    for s in students:
-        # Fetch hostel/room info for display
-        allocation = HostelAllocation.query.filter_by(student_id=s.id).first()
+    for row in rows:
         hostel_info = None
-        if allocation:
-            hostel = Hostel.query.get(allocation.hostel_id)
-            room = Room.query.get(allocation.room_id)
-            if hostel and room:
-                hostel_info = f"{hostel.name} (Room: {room.room_number})"
-        
+        if row.hostel_name and row.room_number:
+            hostel_info = f"{row.hostel_name} (Room: {row.room_number})"
+
         out.append({
-            "id": s.id, "srn": s.srn, "name": s.name, "email": s.email,
-            "degree": s.degree, "semester": s.semester, "section": s.section,
-            "status": s.status,
+            "id": row.id, "srn": row.srn, "name": row.name, "email": row.email,
+            "degree": row.degree, "semester": row.semester, "section": row.section,
+            "status": row.status,
             "hostel_info": hostel_info, # Added hostel information
-            "parent_email": s.parent_email,
-            "parent_access": bool(s.parent_password_hash)
+            "parent_email": row.parent_email,
+            "parent_access": bool(row.parent_access)
         })
-        
-    return jsonify({"success": True, "students": out}), 200
+
+    return jsonify({"success": True, "students": out, **meta}), 200
 
 
 @app.route("/admin/add-faculty", methods=["POST"])
@@ -1731,7 +4277,7 @@ def manage_degrees():
             verify_jwt_in_request()
         except Exception:
             return jsonify({"success": False, "message": "Authentication required to modify degrees"}), 401
-        user = User.query.get(get_jwt_identity())
+        user = get_current_user()
         if user.role.lower() != "admin":
             return jsonify({"success": False, "message": "Admin access required to modify degrees"}), 403
 
@@ -1740,6 +4286,7 @@ def manage_degrees():
         if not name or Degree.query.filter_by(name=name).first():
             return jsonify({"success": False, "message": "Invalid or duplicate degree"}), 400
         db.session.add(Degree(name=name)); db.session.commit()
+        invalidate_reference("degrees")
 
     if request.method == "DELETE":
         name = (request.json or {}).get("name")
@@ -1750,9 +4297,10 @@ def manage_degrees():
             return jsonify({"success": False, "message": "Degree not found"}), 404
         db.session.delete(d)
         db.session.commit()
+        invalidate_reference("degrees")
         return jsonify({"success": True, "message": "Degree deleted successfully"})
 
-    data = [d.name for d in Degree.query.order_by(Degree.name).all()]
+    data = cached_reference("degrees", lambda: [d.name for d in Degree.query.order_by(Degree.name).all()])
     return jsonify({"success": True, "degrees": data})
 
 
@@ -1768,7 +4316,7 @@ def manage_sections():
             verify_jwt_in_request()
         except Exception:
             return jsonify({"success": False, "message": "Authentication required"}), 401
-        user = User.query.get(get_jwt_identity())
+        user = get_current_user()
         if user.role != "admin":
             return jsonify({"success": False, "message": "Admin access required"}), 403
 
@@ -1787,6 +4335,7 @@ def manage_sections():
             
         db.session.add(Section(degree=degree, semester=sem, name=name))
         db.session.commit()
+        invalidate_reference("sections")
     
     if request.method == "DELETE":
         degree, semester, name = get_data()
@@ -1798,26 +4347,28 @@ def manage_sections():
             return jsonify({"success": False, "message": "Section not found"}), 404
         db.session.delete(s)
         db.session.commit()
+        invalidate_reference("sections")
         return jsonify({"success": True, "message": "Section deleted"})
 
     # GET: Filter by degree/sem query params
     degree = request.args.get("degree")
     semester = request.args.get("semester")
     
+    try:
+        sem = int(semester) if semester else None
+    except:
+        sem = None
+
     q = Section.query
     if degree: q = q.filter_by(degree=degree)
-    if semester:
-        try:
-            q = q.filter_by(semester=int(semester))
-        except:
-            pass
+    if sem is not None: q = q.filter_by(semester=sem)
             
     # Return list of names? Or objects? 
     # Current frontend expects list of strings. But now sections are context-dependent.
     # If filtered, returning names is fine. If not filtered, returning unique names might be confusing 
     # but let's stick to returning names for the filtered context.
     
-    data = [s.name for s in q.order_by(Section.name).all()]
+    data = cached_reference("sections", lambda: [s.name for s in q.order_by(Section.name).all()], degree or "", sem or "")
     return jsonify({"success": True, "sections": data})
 
 @app.route("/admin/subjects", methods=["GET", "POST", "DELETE"])
@@ -1848,6 +4399,7 @@ def manage_subjects():
             if Subject.query.filter_by(degree=degree, semester=sem, name=name).first():
                 return jsonify({"success": False, "message": "Duplicate subject"}), 400
             db.session.add(Subject(degree=degree, semester=sem, name=name)); db.session.commit()
+            invalidate_reference("subjects")
 
         if request.method == "DELETE":
             if not (degree and semester and name):
@@ -1857,22 +4409,58 @@ def manage_subjects():
                 return jsonify({"success": False, "message": "Subject not found"}), 404
             db.session.delete(s)
             db.session.commit()
+            invalidate_reference("subjects")
             return jsonify({"success": True, "message": "Subject deleted successfully"})
     
     # --- GET logic (Read operations) ---
     degree = request.args.get("degree"); semester = request.args.get("semester"); q = Subject.query
+    try:
+        sem = int(semester) if semester else None
+    except:
+        sem = None
     if degree: q = q.filter_by(degree=degree)
-    if semester:
-        try:
-            q = q.filter_by(semester=int(semester))
-        except:
-            pass
-    items = [{"degree": s.degree, "semester": s.semester, "name": s.name} for s in q.order_by(Subject.name).all()]
+    if sem is not None: q = q.filter_by(semester=sem)
+    items = cached_reference(
+        "subjects",
+        lambda: [{"degree": s.degree, "semester": s.semester, "name": s.name} for s in q.order_by(Subject.name).all()],
+        degree or "", sem or ""
+    )
     return jsonify({"success": True, "subjects": items})
 
 
 # -------------------- RESOURCES (Notes, Books, Notices) --------------------
 
+@app.route("/uploads/presign", methods=["POST"])
+@jwt_required()
+def presign_direct_upload():
+    """
+    Phase one of a direct upload: returns a presigned POST for the browser to send the
+    file straight to storage. Phase two is the usual create endpoint (/upload-note,
+    /api/admin/library/book, /create-notice, /student/placement/upload-resume) called
+    with upload_id instead of a file.
+    """
+    payload = request.json or {}
+    purpose = payload.get("purpose")
+    if purpose not in DIRECT_UPLOAD_PURPOSES:
+        return jsonify({"success": False, "message": f"purpose must be one of {', '.join(DIRECT_UPLOAD_PURPOSES)}"}), 400
+    roles = DIRECT_UPLOAD_PURPOSES[purpose][1]
+    if roles and get_jwt().get("role") not in roles:
+        return jsonify({"success": False, "message": "Insufficient permissions"}), 403
+    try:
+        size = int(payload["size"]) if payload.get("size") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Invalid size"}), 400
+
+    pending, post = create_direct_upload(purpose, int(get_jwt_identity()), payload.get("filename"),
+                                         payload.get("content_type"), size)
+    db.session.commit()
+    return jsonify({
+        "success": True, "upload_id": pending.id, "key": pending.object_key,
+        "url": post["url"], "fields": post["fields"],
+        "max_bytes": pending.max_bytes, "expires_in": DIRECT_UPLOAD_EXPIRES,
+    })
+
+
 @app.route("/upload-note", methods=["POST"])
 @roles_allowed(["professor", "admin"])
 def upload_note():
@@ -1880,33 +4468,38 @@ def upload_note():
     semester = request.form.get("semester"); section = request.form.get("section")
     subject = request.form.get("subject")
     document_type = request.form.get("document_type"); file = request.files.get("file")
-    if not (title and degree and semester and section and subject and document_type and file):
+    upload_id = request.form.get("upload_id")
+    if not (title and degree and semester and section and subject and document_type and (file or upload_id)):
         return jsonify({"success": False, "message": "Missing fields"}), 400
-    if not allowed_file(file.filename):
-        return jsonify({"success": False, "message": "File type not allowed"}), 400
-
-    ext = file.filename.rsplit(".", 1)[1].lower()
-    filename = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}.{ext}"
-    key = f"notes/{filename}"
-    upload_to_minio(file, key, file.mimetype)
+    if file:
+        if not allowed_file(file.filename):
+            return jsonify({"success": False, "message": "File type not allowed"}), 400
+        # Same PDF for several sections/semesters is stored once and shared
+        key = store_object(file, file.filename, file.mimetype)
+    else:
+        # Already uploaded straight to storage via /uploads/presign
+        key = complete_direct_upload(upload_id, "note")
 
-    identity = get_jwt_identity(); uploader = User.query.get(identity)
+    uploader = get_current_user()
     note = Note(
         title=title, degree=degree, semester=int(semester), section=section, subject=subject,
         document_type=document_type, file_path=key, uploaded_by=uploader.id
     )
-    db.session.add(note); db.session.commit()
-    
-    # Notify Students
-    students = User.query.filter_by(role="student", degree=degree, semester=int(semester), section=section, status="APPROVED").all()
-    for s in students:
-        send_professional_email(
-            s.email,
-            f"New Note: {subject}",
-            "New Study Material Uploaded",
-            {"Subject": subject, "Title": title, "Type": document_type, "Faculty": uploader.name},
-            f"New study material has been uploaded for <strong>{subject}</strong>."
-        )
+    db.session.add(note); db.session.flush()
+    publish_notification("note", f"New {document_type} in {subject}: {title}", class_audience(degree, semester, section),
+                         ref_type="note", ref_id=note.id, created_by=uploader.id)
+    
+    # Notify Students (queued in the same transaction as the note)
+    students = db.session.query(User.email).filter_by(role="student", degree=degree, semester=int(semester), section=section, status="APPROVED").all()
+    # Same content for every recipient: render once, queue the class in one INSERT
+    html, text_body = render_professional_email(
+        "New Study Material Uploaded",
+        {"Subject": subject, "Title": title, "Type": document_type, "Faculty": uploader.name},
+        f"New study material has been uploaded for <strong>{subject}</strong>."
+    )
+    queue_emails({"to_email": s.email, "subject": f"New Note: {subject}", "body": html,
+                  "category": "note", "text_body": text_body} for s in students)
+    db.session.commit()
     
     return jsonify({"success": True, "message": "Note uploaded"})
 
@@ -1914,7 +4507,7 @@ def upload_note():
 @app.route("/notes", methods=["GET"])
 @jwt_required()
 def get_notes():
-    user = User.query.get(get_jwt_identity())
+    user = get_current_user()
     degree = request.args.get("degree") or user.degree; semester = request.args.get("semester") or user.semester
     section = request.args.get("section") or user.section
     subject = request.args.get("subject")
@@ -1932,21 +4525,17 @@ def get_notes():
 
     if subject: q = q.filter_by(subject=subject)
     if document_type: q = q.filter_by(document_type=document_type)
-    notes = q.order_by(Note.timestamp.desc()).all()
+    notes, page = keyset_paginate(q, [Note.timestamp, Note.id], lambda n: (n.timestamp, n.id))
+    urls = presigned_urls(n.file_path for n in notes)
     out = []
     for n in notes:
-        try:
-            file_url = s3_client.generate_presigned_url(
-                "get_object", Params={"Bucket": S3_BUCKET, "Key": n.file_path}, ExpiresIn=3600
-            )
-        except Exception:
-            file_url = None
+        file_url = urls.get(n.file_path)
         out.append({
             "id": n.id, "title": n.title, "degree": n.degree, "semester": n.semester, "section": n.section,
             "subject": n.subject, "document_type": n.document_type, "file_url": file_url,
             "uploaded_by": n.uploaded_by, "timestamp": n.timestamp.isoformat() if n.timestamp else None
         })
-    return jsonify({"success": True, "notes": out})
+    return jsonify({"success": True, "notes": out, **page})
 
 @app.route("/admin/notes/<int:note_id>", methods=["DELETE"])
 @roles_allowed(["admin"])
@@ -1955,14 +4544,9 @@ def admin_delete_note(note_id):
     if not note:
         return jsonify({"success": False, "message": "Note not found"}), 404
 
-    # Best-effort delete from MinIO/S3 first (avoid orphaned objects)
-    if note.file_path:
-        try:
-            s3_client.delete_object(Bucket=S3_BUCKET, Key=note.file_path)
-        except Exception as e:
-            # If object doesn't exist / transient error, still allow DB delete to proceed
-            print(f"Failed to delete note object from storage: {e}")
-
+    # The file may be shared with other notes/notices; storage is cleaned up after commit
+    # only when this was the last reference
+    release_object(note.file_path)
     db.session.delete(note)
     db.session.commit()
     return jsonify({"success": True, "message": "Note deleted"})
@@ -1974,17 +4558,16 @@ def upload_book():
     title = request.form.get("title"); author = request.form.get("author")
     degree = request.form.get("degree"); semester = request.form.get("semester")
     isbn = request.form.get("isbn") # Optionally allow ISBN input
-    file = request.files.get("file")
+    file = request.files.get("file"); upload_id = request.form.get("upload_id")
     
-    if not (title and author and degree and semester and file):
+    if not (title and author and degree and semester and (file or upload_id)):
         return jsonify({"success": False, "message": "Missing title, author, degree, semester, or file"}), 400
-    if not allowed_file(file.filename):
-        return jsonify({"success": False, "message": "File type not allowed"}), 400
-
-    ext = file.filename.rsplit(".", 1)[1].lower()
-    filename = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}.{ext}"
-    key = f"books/{filename}"
-    upload_to_minio(file, key, file.mimetype)
+    if file:
+        if not allowed_file(file.filename):
+            return jsonify({"success": False, "message": "File type not allowed"}), 400
+        key = store_object(file, file.filename, file.mimetype)
+    else:
+        key = complete_direct_upload(upload_id, "book")
 
     identity = get_jwt_identity()
     book = Book(
@@ -2014,15 +4597,10 @@ def search_library():
             Book.isbn.ilike(f"%{q}%") # Search by ISBN too
         )).limit(20).all()
 
+        # Temporary download links, signed in one batch (and reused while still fresh)
+        urls = presigned_urls(b.file_path for b in books)
         for b in books:
-            file_url = None
-            try:
-                # Generate a temporary download link
-                file_url = s3_client.generate_presigned_url(
-                    "get_object", Params={"Bucket": S3_BUCKET, "Key": b.file_path}, ExpiresIn=3600
-                )
-            except Exception:
-                file_url = None
+            file_url = urls.get(b.file_path)
                 
             # Internal book structure
             out.append({
@@ -2050,18 +4628,12 @@ def create_notice():
     title = data.get("title"); message = data.get("message"); degree = data.get("degree")
     semester = data.get("semester"); section = data.get("section"); subject = data.get("subject")
     deadline_raw = data.get("deadline"); file = request.files.get("attachment")
+    upload_id = data.get("upload_id")
     if not (title and message and degree and semester and section and subject):
         return jsonify({"success": False, "message": "Missing fields"}), 400
     if file and not allowed_file(file.filename):
         return jsonify({"success": False, "message": "Attachment type not allowed"}), 400
 
-    attachment_key = None
-    if file:
-        ext = file.filename.rsplit(".", 1)[1].lower()
-        fname = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}.{ext}"
-        attachment_key = f"notices/{fname}"
-        upload_to_minio(file, attachment_key, file.mimetype)
-
     deadline = None
     if deadline_raw:
         try:
@@ -2069,33 +4641,39 @@ def create_notice():
         except:
             return jsonify({"success": False, "message": "Invalid deadline format (YYYY-MM-DD)"}), 400
 
-    identity = get_jwt_identity(); prof = User.query.get(identity)
+    attachment_key = None
+    if file:
+        attachment_key = store_object(file, file.filename, file.mimetype)
+    elif upload_id:
+        attachment_key = complete_direct_upload(upload_id, "notice")
+
+    prof = get_current_user()
     notice = Notice(
         title=title, message=message, degree=degree, semester=int(semester),
         section=section, subject=subject, deadline=deadline, attachment=attachment_key,
         professor_id=prof.id, professor_name=prof.name
     )
-    db.session.add(notice); db.session.commit()
+    db.session.add(notice); db.session.flush()
+    publish_notification("notice", title, class_audience(degree, semester, section), body=message,
+                         ref_type="notice", ref_id=notice.id, created_by=prof.id)
 
-    # Notify Students
+    # Notify Students (queued in the same transaction as the notice)
     try:
         sections_list = [s.strip().upper() for s in section.split(",")] if section else []
-        q = User.query.filter_by(role="student", degree=degree, semester=int(semester), status="APPROVED")
+        q = db.session.query(User.email).filter_by(role="student", degree=degree, semester=int(semester), status="APPROVED")
         if sections_list:
              q = q.filter(User.section.in_(sections_list))
         
         students = q.all()
-        for s in students:
-             details = {"Subject": subject, "Posted By": prof.name, "Deadline": str(deadline) if deadline else "N/A"}
-             send_professional_email(
-                 s.email, 
-                 f"New Notice: {title}", 
-                 "Important Notice", 
-                 details, 
-                 f"{message[:200]}..." if len(message) > 200 else message
-             )
+        details = {"Subject": subject, "Posted By": prof.name, "Deadline": str(deadline) if deadline else "N/A"}
+        html, text_body = render_professional_email(
+            "Important Notice", details, f"{message[:200]}..." if len(message) > 200 else message
+        )
+        queue_emails({"to_email": s.email, "subject": f"New Notice: {title}", "body": html,
+                      "category": "notice", "text_body": text_body} for s in students)
     except Exception as e:
-        print(f"Error sending notice emails: {e}")
+        print(f"Error queueing notice emails: {e}")
+    db.session.commit()
 
     return jsonify({"success": True, "message": "Notice created"})
 
@@ -2103,17 +4681,17 @@ def create_notice():
 @app.route("/notices", methods=["GET"])
 @jwt_required()
 def get_notices():
-    user = User.query.get(get_jwt_identity()); q = Notice.query
+    user = get_current_user(); q = Notice.query
     subject = request.args.get("subject")
 
     if user.role == "student":
+        if not user.section:
+            return jsonify({"success": True, "notices": []})
         q = q.filter_by(degree=user.degree, semester=user.semester)
-        items = q.order_by(Notice.created_at.desc()).all(); filtered = []
-        for n in items:
-            sections = [s.strip().upper() for s in n.section.split(",")] if n.section else []
-            if user.section and user.section.upper() in sections and (not subject or n.subject == subject):
-                filtered.append(n)
-        results = filtered
+        # Notice.section is a comma-separated list ("A, B"); match the student's section as a whole item
+        normalized = "," + func.upper(func.replace(Notice.section, " ", "")) + ","
+        q = q.filter(normalized.like(f"%,{user.section.replace(' ', '').upper()},%"))
+        if subject: q = q.filter_by(subject=subject)
     else:
         degree = request.args.get("degree"); semester = request.args.get("semester"); section = request.args.get("section")
         if degree: q = q.filter_by(degree=degree)
@@ -2125,18 +4703,13 @@ def get_notices():
         if section:
             q = q.filter(Notice.section.ilike(f"%{section}%"))
         if subject: q = q.filter_by(subject=subject)
-        results = q.order_by(Notice.created_at.desc()).all()
 
+    results, page = keyset_paginate(q, [Notice.created_at, Notice.id], lambda n: (n.created_at, n.id))
+
+    urls = presigned_urls(n.attachment for n in results)
     out = []
     for n in results:
-        attachment_url = None
-        if n.attachment:
-            try:
-                attachment_url = s3_client.generate_presigned_url(
-                    "get_object", Params={"Bucket": S3_BUCKET, "Key": n.attachment}, ExpiresIn=3600
-                )
-            except Exception:
-                attachment_url = None
+        attachment_url = urls.get(n.attachment)
         out.append({
             "id": n.id, "title": n.title, "message": n.message, "degree": n.degree,
             "semester": n.semester, "section": n.section, "subject": n.subject,
@@ -2144,7 +4717,52 @@ def get_notices():
             "professor_id": n.professor_id, "professor_name": n.professor_name,
             "created_at": n.created_at.isoformat() if n.created_at else None
         })
-    return jsonify({"success": True, "notices": out})
+    return jsonify({"success": True, "notices": out, **page})
+
+
+@app.route("/notifications", methods=["GET"])
+@roles_allowed(["student", "parent"])
+def get_notifications():
+    """In-app feed (newest first) with unread count. Optional ?kind=; paged with ?limit/&cursor."""
+    student = get_current_user() # Parent token identity is the Student ID
+    q = FeedNotification.query.filter(FeedNotification.id.in_(feed_query_for(student).scalar_subquery()))
+    if request.args.get("kind"):
+        q = q.filter(FeedNotification.kind == request.args["kind"])
+
+    state = FeedReadState.query.get((student.id, get_jwt().get("role")))
+    watermark = state.last_read_id if state else 0
+    unread = q.filter(FeedNotification.id > watermark).count()
+    rows, page = keyset_paginate(q, [FeedNotification.id], lambda n: (n.id,))
+    return jsonify({"success": True, "unread_count": unread, "last_read_id": watermark, "notifications": [{
+        "id": n.id, "kind": n.kind, "title": n.title, "body": n.body,
+        "ref_type": n.ref_type, "ref_id": n.ref_id, "read": n.id <= watermark,
+        "created_at": n.created_at.isoformat() if n.created_at else None,
+    } for n in rows], **page})
+
+
+@app.route("/notifications/read", methods=["POST"])
+@roles_allowed(["student", "parent"])
+def mark_notifications_read():
+    """Moves the read watermark forward to up_to_id (default: newest notification). Never moves it back."""
+    student = get_current_user()
+    up_to = (request.json or {}).get("up_to_id")
+    if up_to is None:
+        up_to = db.session.query(func.max(FeedNotification.id)).filter(
+            FeedNotification.id.in_(feed_query_for(student).scalar_subquery())
+        ).scalar() or 0
+    try:
+        up_to = int(up_to)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "up_to_id must be an integer"}), 400
+
+    role = get_jwt().get("role")
+    state = FeedReadState.query.get((student.id, role))
+    if state is None:
+        state = FeedReadState(user_id=student.id, role=role, last_read_id=0); db.session.add(state)
+    if up_to > state.last_read_id:
+        state.last_read_id = up_to; state.updated_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify({"success": True, "last_read_id": state.last_read_id})
 
 
 # -------------------- NEW HOSTEL MANAGEMENT ROUTES (ADMIN) --------------------
@@ -2329,17 +4947,11 @@ def student_view_hostel_complaints():
         outerjoin(Room, HostelComplaint.room_id == Room.id).\
         order_by(HostelComplaint.created_at.desc()).all()
 
+    # Temporary download links for the attachments
+    urls = presigned_urls(c.attachment for c, _, _ in complaints)
     out = []
     for c, hostel, room in complaints:
-        file_url = None
-        if c.attachment:
-            try:
-                # Generate a temporary download link for the attachment
-                file_url = s3_client.generate_presigned_url(
-                    "get_object", Params={"Bucket": S3_BUCKET, "Key": c.attachment}, ExpiresIn=3600
-                )
-            except Exception:
-                file_url = None
+        file_url = urls.get(c.attachment)
                 
         # Parse audit trail for live tracking/history
         try:
@@ -2371,16 +4983,10 @@ def view_hostel_complaints():
         outerjoin(Room, HostelComplaint.room_id == Room.id).\
         order_by(HostelComplaint.created_at.desc()).all()
         
+    urls = presigned_urls(c.attachment for c, _, _, _ in complaints)
     out = []
     for c, student, hostel, room in complaints:
-        file_url = None
-        if c.attachment:
-            try:
-                file_url = s3_client.generate_presigned_url(
-                    "get_object", Params={"Bucket": S3_BUCKET, "Key": c.attachment}, ExpiresIn=3600
-                )
-            except Exception:
-                file_url = None
+        file_url = urls.get(c.attachment)
                 
         # Parse audit trail for frontend display
         try:
@@ -2423,7 +5029,7 @@ def update_hostel_complaint_status(complaint_id):
     
     # Update audit trail
     trail = json.loads(complaint.audit_trail)
-    admin_user = User.query.get(get_jwt_identity())
+    admin_user = get_current_user()
     trail.append({
         "status": new_status,
         "timestamp": datetime.utcnow().isoformat(),
@@ -2431,13 +5037,13 @@ def update_hostel_complaint_status(complaint_id):
         "note": note
     })
     complaint.audit_trail = json.dumps(trail)
-    db.session.commit()
     
     # Notify Student
     s = User.query.get(complaint.student_id)
     if s:
         details = {"Complaint ID": f"#{complaint.id[:8]}", "Title": complaint.title, "New Status": new_status, "Admin Note": note}
-        send_professional_email(s.email, f"Complaint Update: {new_status}", "Hostel Complaint Updated", details, f"The status of your hostel complaint '<strong>{complaint.title}</strong>' has been updated.")
+        queue_professional_email(s.email, f"Complaint Update: {new_status}", "Hostel Complaint Updated", details, f"The status of your hostel complaint '<strong>{complaint.title}</strong>' has been updated.", category="complaint")
+    db.session.commit()
     
     return jsonify({"success": True, "message": f"Complaint status updated to {new_status}.", "new_status": new_status})
 
@@ -2473,9 +5079,10 @@ def admin_create_fee_notification():
     )
     db.session.add(notif); db.session.flush()
 
-    target = notif.target; created_targets = 0
+    target = notif.target; created_targets = 0; fee_audience = []
     if target in ("batch", "sem"):
         degree = payload.get("degree"); semester = payload.get("semester"); sections = payload.get("sections", "")
+        fee_audience = class_audience(degree, semester, sections)
         q = User.query.filter_by(role="student")
         if degree: q = q.filter_by(degree=degree)
         if semester: q = q.filter_by(semester=int(semester))
@@ -2484,37 +5091,51 @@ def admin_create_fee_notification():
             students = q.filter(User.section.in_(secs)).all()
         else:
             students = q.all()
+        details = {"Title": title, "Amount": f"INR {amount_cents/100}", "Due Date": str(payload.get("due_date"))}
+        student_html, student_text = render_professional_email("New Fee Notification", details, "A new fee payment is due.")
+        emails = []
         for s in students:
             ft = FeeTarget(notification_id=notif.id, student_id=s.id)
             db.session.add(ft); created_targets += 1
             # Notify
-            details = {"Title": title, "Amount": f"INR {amount_cents/100}", "Due Date": str(payload.get("due_date"))}
-            send_professional_email(s.email, f"Fee Demand: {title}", "New Fee Notification", details, "A new fee payment is due.")
+            emails.append({"to_email": s.email, "subject": f"Fee Demand: {title}", "body": student_html,
+                           "category": "fee", "text_body": student_text})
             if s.parent_email:
-                send_professional_email(s.parent_email, f"Fee Demand: {s.name}", f"Fee Notification for {s.name}", details, f"A new fee payment is requested for your ward.")
+                parent_html, parent_text = render_professional_email(f"Fee Notification for {s.name}", details, f"A new fee payment is requested for your ward.")
+                emails.append({"to_email": s.parent_email, "subject": f"Fee Demand: {s.name}", "body": parent_html,
+                               "category": "fee", "text_body": parent_text})
+        queue_emails(emails)
     elif target == "custom":
         srns = payload.get("srns", []) or []
+        details = {"Title": title, "Amount": f"INR {amount_cents/100}", "Due Date": str(payload.get("due_date"))}
+        student_html, student_text = render_professional_email("New Fee Notification", details, "A new fee payment is due.")
+        emails = []
         for srn in srns:
             user = User.query.filter_by(srn=srn).first()
             if user:
                 ft = FeeTarget(notification_id=notif.id, student_id=user.id)
-                db.session.add(ft); created_targets += 1
+                db.session.add(ft); created_targets += 1; fee_audience += student_audience([user.id])
                 # Notify
-                details = {"Title": title, "Amount": f"INR {amount_cents/100}", "Due Date": str(payload.get("due_date"))}
-                send_professional_email(user.email, f"Fee Demand: {title}", "New Fee Notification", details, "A new fee payment is due.")
+                emails.append({"to_email": user.email, "subject": f"Fee Demand: {title}", "body": student_html,
+                               "category": "fee", "text_body": student_text})
                 if user.parent_email:
-                    send_professional_email(user.parent_email, f"Fee Demand: {user.name}", f"Fee Notification for {user.name}", details, f"A new fee payment is requested for your ward.")
+                    parent_html, parent_text = render_professional_email(f"Fee Notification for {user.name}", details, f"A new fee payment is requested for your ward.")
+                    emails.append({"to_email": user.parent_email, "subject": f"Fee Demand: {user.name}", "body": parent_html,
+                                   "category": "fee", "text_body": parent_text})
+        queue_emails(emails)
     elif target == "single":
         srn = payload.get("single_srn")
         user = User.query.filter_by(srn=srn).first()
         if user:
             ft = FeeTarget(notification_id=notif.id, student_id=user.id)
-            db.session.add(ft); created_targets += 1
+            db.session.add(ft); created_targets += 1; fee_audience = student_audience([user.id])
             # Notify
             details = {"Title": title, "Amount": f"INR {amount_cents/100}", "Due Date": str(payload.get("due_date"))}
-            send_professional_email(user.email, f"Fee Demand: {title}", "New Fee Notification", details, "A new fee payment is due.")
+            queue_professional_email(user.email, f"Fee Demand: {title}", "New Fee Notification", details, "A new fee payment is due.", category="fee")
             if user.parent_email:
-                send_professional_email(user.parent_email, f"Fee Demand: {user.name}", f"Fee Notification for {user.name}", details, f"A new fee payment is requested for your ward.")
+                queue_professional_email(user.parent_email, f"Fee Demand: {user.name}", f"Fee Notification for {user.name}", details, f"A new fee payment is requested for your ward.", category="fee")
+    publish_notification("fee", f"Fee Demand: {title} (INR {amount_cents/100})", fee_audience, body=notif.description,
+                         ref_type="fee_notification", ref_id=notif.id, created_by=notif.issued_by)
     db.session.commit()
     return jsonify({"success": True, "notification_id": notif.id, "targets_created": created_targets})
 
@@ -2523,7 +5144,8 @@ def admin_create_fee_notification():
 @jwt_required()
 def student_fees_list():
     uid = int(get_jwt_identity())
-    results = db.session.query(FeeTarget, FeeNotification).join(FeeNotification, FeeTarget.notification_id == FeeNotification.id).filter(FeeTarget.student_id == uid).order_by(FeeNotification.created_at.desc()).all()
+    q = db.session.query(FeeTarget, FeeNotification).join(FeeNotification, FeeTarget.notification_id == FeeNotification.id).filter(FeeTarget.student_id == uid)
+    results, page = keyset_paginate(q, [FeeNotification.created_at, FeeTarget.id], lambda r: (r[1].created_at, r[0].id))
     items = []
     for ft, notif in results:
         items.append({
@@ -2534,7 +5156,7 @@ def student_fees_list():
             "status": ft.status, "paid_at": ft.paid_at.isoformat() if ft.paid_at else None,
             "payment_id": ft.order_id or None
         })
-    return jsonify({"success": True, "fees": items})
+    return jsonify({"success": True, "fees": items, **page})
 
 
 @app.route("/fees/pay", methods=["POST"])
@@ -2614,9 +5236,9 @@ def get_receipt_for_payment(payment_id):
     rec = Receipt.query.filter_by(payment_id=payment_id).first()
     if not rec:
         return jsonify({"success": False, "message": "Receipt not found"}), 404
-    url = s3_client.generate_presigned_url(
-        "get_object", Params={"Bucket": S3_BUCKET, "Key": rec.storage_key}, ExpiresIn=3600
-    )
+    url = presigned_url(rec.storage_key)
+    if not url:
+        return jsonify({"success": False, "message": "Could not generate receipt link"}), 502
     return jsonify({"success": True, "receipt_url": url})
 
 
@@ -2651,28 +5273,32 @@ def faculty_upload_marks():
         marks_obtained=marks, max_marks=max_m,
         uploaded_by=uploader_id
     )
-    db.session.add(m); 
-    db.session.commit()
+    db.session.add(m); db.session.flush()
+    publish_notification("marks", f"Marks released: {subject} ({exam_type})", student_audience([user.id]),
+                         body=f"{marks}/{max_m}", ref_type="mark", ref_id=m.id, created_by=uploader_id)
     
     # Notify Student
     details = {"Subject": subject, "Exam Type": exam_type, "Score": f"{marks}/{max_m}", "Percentage": f"{(marks/max_m)*100:.1f}%"}
-    send_professional_email(
+    queue_professional_email(
         user.email, 
         f"Marks Released: {subject}", 
         "New Assessment Score", 
         details, 
-        "Your marks for the recent assessment have been published."
+        "Your marks for the recent assessment have been published.",
+        category="marks"
     )
     
     # Notify Parent
     if user.parent_email:
-        send_professional_email(
+        queue_professional_email(
             user.parent_email, 
             f"Academic Alert: {user.name} - {subject}", 
             f"Marks Published for {user.name}", 
             details, 
-            f"New marks have been uploaded for your ward, <strong>{user.name}</strong>."
+            f"New marks have been uploaded for your ward, <strong>{user.name}</strong>.",
+            category="marks"
         )
+    db.session.commit()
     
     return jsonify({"success": True, "message": f"Marks uploaded for {user.name}."})
 
@@ -2707,13 +5333,16 @@ def faculty_add_feedback():
     fb = Feedback(
         student_id=student.id, subject=subject, faculty_id=int(get_jwt_identity()), text=text
     )
-    db.session.add(fb); db.session.commit(); 
+    db.session.add(fb); db.session.flush()
+    publish_notification("feedback", f"New feedback: {subject}", student_audience([student.id]),
+                         ref_type="feedback", ref_id=fb.id, created_by=fb.faculty_id)
     
     # Notify Student & Parent
-    details = {"Subject": subject, "Faculty": User.query.get(int(get_jwt_identity())).name, "Feedback": text}
-    send_professional_email(student.email, f"New Feedback: {subject}", "Faculty Feedback Received", details, "You have received new feedback from your professor.")
+    details = {"Subject": subject, "Faculty": get_current_user().name, "Feedback": text}
+    queue_professional_email(student.email, f"New Feedback: {subject}", "Faculty Feedback Received", details, "You have received new feedback from your professor.", category="feedback")
     if student.parent_email:
-        send_professional_email(student.parent_email, f"Feedback: {student.name} - {subject}", f"Faculty Feedback for {student.name}", details, f"Faculty has provided feedback for your ward, <strong>{student.name}</strong>.")
+        queue_professional_email(student.parent_email, f"Feedback: {student.name} - {subject}", f"Faculty Feedback for {student.name}", details, f"Faculty has provided feedback for your ward, <strong>{student.name}</strong>.", category="feedback")
+    db.session.commit()
 
     return jsonify({"success": True, "message": "Feedback saved"})
 
@@ -2800,13 +5429,27 @@ def mark_attendance():
         # Check existing logic? Optional: Prevent double marking or just overwrite?
         # User requested "editable for 30 mins".
         
-        count = 0
+        # One mark per student; a student repeated in the payload keeps the last status given
+        marks = {}
         for item in items:
-            sid = item.get("student_id")
-            status = item.get("status")
+            try:
+                marks[int(item.get("student_id"))] = item.get("status")
+            except (TypeError, ValueError, AttributeError):
+                return jsonify({"success": False, "message": "Each item needs a numeric student_id"}), 400
+
+        # Existing marks and student rows for the whole batch in two queries
+        sids = list(marks)
+        existing = {a.student_id: a for a in Attendance.query.filter(
+            Attendance.student_id.in_(sids), Attendance.subject == subject, Attendance.date == date_obj
+        )}
+        students = {u.id: u for u in User.query.filter(User.id.in_(sids))}
+        absent_ids, present_ids = [], []
+
+        count = 0
+        for sid, status in marks.items():
             
             # Check existing
-            exist = Attendance.query.filter_by(student_id=sid, subject=subject, date=date_obj).first()
+            exist = existing.get(sid)
             if exist:
                 # Check edit window
                 window = datetime.utcnow() - exist.timestamp
@@ -2829,19 +5472,12 @@ def mark_attendance():
                 )
                 db.session.add(new_att)
             
-            # Notify if Absent
-            if status == "Absent":
-                stu = User.query.get(sid)
-                if stu:
-                    details = {"Subject": subject, "Date": date_str, "Status": "Absent"}
-                    # Notify Student
-                    send_professional_email(stu.email, f"Attendance Alert: Absent for {subject}", "Absence Recorded", details, f"You have been marked <strong>Absent</strong> for {subject} on {date_str}.")
-                    # Notify Parent
-                    if stu.parent_email:
-                        send_professional_email(stu.parent_email, f"Attendance Alert: {stu.name} Absent", f"Absence Alert for {stu.name}", details, f"Your ward <strong>{stu.name}</strong> was marked Absent for {subject} on {date_str}.")
-
+            (absent_ids if status == "Absent" else present_ids).append(sid)
             count += 1
             
+        # Notify (buffered into digests unless immediate alerts are configured)
+        notify_absences(students, subject, date_obj, absent_ids, present_ids)
+
         db.session.commit()
         return jsonify({"success": True, "message": f"Attendance marked for {count} students."})
 
@@ -2851,23 +5487,68 @@ def mark_attendance():
         return jsonify({"success": False, "message": "Use POST to mark or update."})
 
 
+@app.route("/admin/attendance/export", methods=["GET"])
+@admin_only
+def export_attendance():
+    """Streams attendance as CSV. Filters: degree, semester, section, subject, date_from, date_to."""
+    q = db.session.query(
+        Attendance.date, Attendance.subject, Attendance.degree, Attendance.semester, Attendance.section,
+        User.srn, User.name, Attendance.status, Attendance.timestamp,
+    ).join(User, User.id == Attendance.student_id)
+
+    for field in ("degree", "section", "subject"):
+        if request.args.get(field):
+            q = q.filter(getattr(Attendance, field) == request.args[field])
+    try:
+        if request.args.get("semester"):
+            q = q.filter(Attendance.semester == int(request.args["semester"]))
+        if request.args.get("date_from"):
+            q = q.filter(Attendance.date >= datetime.strptime(request.args["date_from"], "%Y-%m-%d").date())
+        if request.args.get("date_to"):
+            q = q.filter(Attendance.date <= datetime.strptime(request.args["date_to"], "%Y-%m-%d").date())
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid filter parameters."}), 400
+
+    q = q.order_by(Attendance.date, Attendance.id)
+
+    def generate():
+        buf = io.StringIO(); writer = csv.writer(buf)
+        writer.writerow(["Date", "Subject", "Degree", "Semester", "Section", "SRN", "Name", "Status", "Marked At"])
+        for row in stream_query(q):
+            writer.writerow([
+                row.date.isoformat(), row.subject, row.degree, row.semester, row.section,
+                row.srn or "", row.name, row.status, row.timestamp.isoformat() if row.timestamp else "",
+            ])
+            if buf.tell() > 64 * 1024:
+                yield buf.getvalue(); buf.seek(0); buf.truncate()
+        yield buf.getvalue()
+
+    filename = f"attendance_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.csv"
+    return Response(
+        stream_with_context(generate()), mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @app.route("/student/attendance", methods=["GET"])
 @roles_allowed(["student", "parent"])
 def get_my_attendance():
     uid = int(get_jwt_identity())
     # Return list of {date, subject, status}
-    rows = Attendance.query.filter_by(student_id=uid).order_by(Attendance.date.desc()).all()
+    rows, page = keyset_paginate(
+        Attendance.query.filter_by(student_id=uid), [Attendance.date, Attendance.id], lambda r: (r.date, r.id)
+    )
     out = [{
         "date": r.date.isoformat(),
         "subject": r.subject,
         "status": r.status
     } for r in rows]
-    return jsonify({"success": True, "attendance": out})
+    return jsonify({"success": True, "attendance": out, **page})
 
 
 # -------------------- AI CHAT (Gemini) --------------------
 
-def call_groq_api(prompt: str):
+def call_groq_api(prompt: str, cache_ttl=0):
     # Check if the key is loaded and present
     if not GROQ_API_KEY:
         return None, "GROQ_API_KEY environment variable is missing or empty."
@@ -2875,12 +5556,18 @@ def call_groq_api(prompt: str):
     API_URL = "https://api.groq.com/openai/v1/chat/completions"
     MAX_RETRIES = 3
     payload = {
-        "model": "llama-3.3-70b-versatile",
+        "model": GROQ_MODEL,
         "messages": [
             {"role": "system", "content": "You are Orbit Bot, an Academic Assistant trained by Meta and tuned at LeafCore Labs. If asked who you are, introduce yourself using this identity. Provide helpful, concise, and academically relevant answers."},
             {"role": "user", "content": prompt}
         ]
     }
+    # cache_ttl > 0: reuse an identical earlier answer (see GroqResponseCache)
+    cache_key = groq_cache.key(GROQ_MODEL, payload["messages"]) if cache_ttl > 0 else None
+    if cache_key:
+        cached = groq_cache.get(cache_key)
+        if cached is not None:
+            return cached, None
     for attempt in range(MAX_RETRIES):
         try:
             response = requests.post(API_URL, headers={'Authorization': f'Bearer {GROQ_API_KEY}', 'Content-Type': 'application/json'}, data=json.dumps(payload))
@@ -2888,6 +5575,8 @@ def call_groq_api(prompt: str):
             result = response.json()
             text = result.get('choices', [{}])[0].get('message', {}).get('content')
             if text:
+                if cache_key:
+                    groq_cache.set(cache_key, GROQ_MODEL, text, cache_ttl)
                 return text, None
             else:
                 return None, f"API returned an empty response. Response JSON: {result}"
@@ -3016,9 +5705,12 @@ def chat():
 @jwt_required()
 def get_ai_sessions():
     uid = int(get_jwt_identity())
-    sessions = AIChatSession.query.filter_by(user_id=uid).order_by(AIChatSession.updated_at.desc()).all()
+    sessions, page = keyset_paginate(
+        AIChatSession.query.filter_by(user_id=uid), [AIChatSession.updated_at, AIChatSession.id],
+        lambda s: (s.updated_at, s.id)
+    )
     out = [{"id": s.id, "title": s.title, "updated_at": s.updated_at.isoformat()} for s in sessions]
-    return jsonify({"success": True, "sessions": out})
+    return jsonify({"success": True, "sessions": out, **page})
 
 
 @app.route("/ai/session/<session_id>", methods=["GET", "DELETE"])
@@ -3053,7 +5745,7 @@ def get_academic_insights():
     Returns: JSON with risks, priorities, and persona-based advice.
     """
     current_uid = int(get_jwt_identity())
-    user = User.query.get(current_uid)
+    user = get_current_user()
     
     # If parent, get ward's ID
     student_id = current_uid
@@ -3116,7 +5808,7 @@ def get_academic_insights():
     """
     
     # 5. Call AI
-    ai_response, error = call_groq_api(prompt)
+    ai_response, error = call_groq_api(prompt, cache_ttl=AI_CACHE_TTL)
     
     if not ai_response:
         # Fallback if AI fails
@@ -3145,8 +5837,72 @@ def get_academic_insights():
 
 # -------------------- DB INIT --------------------
 
+def ensure_columns():
+    """
+    Adds nullable columns declared on models but missing from existing tables.
+    db.create_all() never alters a table; NOT NULL additions still need a hand migration.
+    """
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing or not col.nullable or col.primary_key:
+                    continue
+                col_type = col.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(col.name)} {col_type}"))
+                added.append(f"{table.name}.{col.name}")
+    if added:
+        print("Added missing columns:", ", ".join(added))
+
+
+def ensure_indexes():
+    """
+    Creates any declared index missing from an existing database.
+    db.create_all() skips tables that already exist, so indexes added to models
+    later never reach an old noteorbit.db without this pass.
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not table.indexes or not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=db.engine)
+                created.append(index.name)
+            except Exception as e:
+                print(f"Failed to create index {index.name}: {e}")
+    if created:
+        print("Created indexes:", ", ".join(created))
+    return created
+
+
+def backfill_resume_keys():
+    """Profiles from before resume_key only kept a presigned URL; store the key it points at instead."""
+    profiles = StudentPlacementProfile.query.filter(
+        StudentPlacementProfile.resume_key.is_(None), StudentPlacementProfile.resume_url.isnot(None)
+    ).all()
+    for prof in profiles:
+        set_resume_link(prof, prof.resume_url)
+    filled = sum(1 for prof in profiles if prof.resume_key)
+    db.session.commit()
+    if filled:
+        print(f"Backfilled resume_key for {filled} placement profile(s)")
+
+
 def init_db():
     db.create_all() # This now includes Hostel, Room, and HostelAllocation
+    ensure_columns()
+    ensure_indexes()
+    backfill_resume_keys()
     admin_email = DEFAULT_ADMIN_EMAIL
     admin_password = DEFAULT_ADMIN_PASSWORD
     if not User.query.filter_by(email=admin_email).first():
@@ -3160,8 +5916,10 @@ def init_db():
             db.session.add(Degree(name=d))
         db.session.commit()
     if Section.query.count() == 0:
-        for s in ["A", "B", "C"]:
-            db.session.add(Section(name=s))
+        # Sections are scoped to a degree and semester; seed semester 1 of each degree
+        for d in Degree.query.all():
+            for s in ["A", "B", "C"]:
+                db.session.add(Section(degree=d.name, semester=1, name=s))
         db.session.commit()
         
     # NEW: Initial Hostel/Room for testing (Optional but helpful)
@@ -3200,13 +5958,61 @@ def init_db():
     os.makedirs(RECEIPT_TMP_DIR, exist_ok=True)
 
 
+_db_initialised = False
+
+
+def init_db_once():
+    """
+    Runs init_db() at most once per process and one process at a time. Workers booting
+    together queue on a host-wide file lock (plus an advisory lock on PostgreSQL, which
+    also covers other hosts); init_db() is idempotent, so the ones that follow no-op.
+    """
+    global _db_initialised
+    if _db_initialised:
+        return
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    with open(os.path.join(TEMP_DIR, "db_init.lock"), "w") as lock_file, app.app_context():
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        conn = db.engine.connect() if db.engine.dialect.name == "postgresql" else None
+        try:
+            if conn is not None:
+                conn.exec_driver_sql(f"SELECT pg_advisory_lock({DB_INIT_LOCK_ID})")
+            init_db()
+        finally:
+            if conn is not None:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({DB_INIT_LOCK_ID})")
+                conn.close()
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    _db_initialised = True
+
+
 # -------------------- PARENT COMMUNICATION ROUTES --------------------
 
+@app.route("/parent/alert-preferences", methods=["GET", "PUT"])
+@roles_allowed(["parent"])
+def parent_alert_preferences():
+    """Parents choose a periodic absence digest (default) or one email per Absent mark."""
+    if request.method == "GET":
+        user = get_current_user()
+        return jsonify({"success": True, "absence_alerts": user.parent_alert_mode or "digest",
+                        "digest_hours": ABSENCE_DIGEST_HOURS})
+    mode = (request.json or {}).get("absence_alerts")
+    if mode not in ("digest", "immediate"):
+        return jsonify({"success": False, "message": "absence_alerts must be 'digest' or 'immediate'"}), 400
+    student = User.query.get(get_jwt_identity()) # Parent token identity is the Student ID
+    student.parent_alert_mode = mode
+    db.session.commit()
+    invalidate_user_cache(student.id)
+    return jsonify({"success": True, "absence_alerts": mode})
+
+
 @app.route("/parent/professors", methods=["GET"])
 @roles_allowed(["parent", "student"]) # Allow both to see their professors
 def parent_get_professors():
     identity = get_jwt_identity()
-    user = User.query.get(identity)
+    user = get_current_user()
     if not user:
         return jsonify({"success": False, "message": "User not found"}), 404
 
@@ -3239,7 +6045,7 @@ def parent_get_professors():
 @roles_allowed(["parent"]) 
 def parent_contact_professor():
     identity = get_jwt_identity()
-    student = User.query.get(identity) # Parent token identity is the Student ID
+    student = get_current_user() # Parent token identity is the Student ID
     if not student:
         return jsonify({"success": False, "message": "Student record not found"}), 404
 
@@ -3261,32 +6067,11 @@ def parent_contact_professor():
     
     email_subject = f"[NoteOrbit] Parent Query: {student.name} ({student.srn})"
     
-    html_content = f"""
-    <div style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; border: 1px solid #eee; border-radius: 8px; overflow: hidden;">
-        <div style="background-color: #3b82f6; padding: 20px; color: white;">
-            <h2 style="margin: 0;">Parent Communication</h2>
-            <p style="margin: 5px 0 0; opacity: 0.9;">From the desk of {student.name}'s Guardian</p>
-        </div>
-        <div style="padding: 30px;">
-            <p><strong>To:</strong> Prof. {prof.name}</p>
-            <p><strong>Regarding Student:</strong> {student.name} ({student.srn})</p>
-            <p><strong>Class:</strong> {student.degree} - Sem {student.semester} (Sec {student.section})</p>
-            <hr style="border: 0; border-top: 1px solid #eee; margin: 20px 0;">
-            
-            <h3 style="color: #3b82f6; margin-top: 0;">{subject_line}</h3>
-            <p style="background-color: #f9fafb; padding: 15px; border-radius: 6px; border-left: 4px solid #3b82f6;">
-                "{message_body}"
-            </p>
-            
-            <p style="margin-top: 30px; font-size: 13px; color: #666;">
-                You can reply directly to this email to contact the parent at <a href="mailto:{reply_to}">{reply_to}</a>.
-            </p>
-        </div>
-         <div style="background-color: #f4f4f9; padding: 15px; text-align: center; font-size: 12px; color: #999;">
-            NoteOrbit Academic Portal
-        </div>
-    </div>
-    """
+    html_content, text_content = render_email_template(
+        "parent_query", student_name=student.name, srn=student.srn, degree=student.degree,
+        semester=student.semester, section=student.section, professor_name=prof.name,
+        subject=subject_line, message=message_body, reply_to=reply_to,
+    )
 
     # We can't strictly set "Reply-To" in our simple helper without modification, 
     # but we can try injecting it into headers if we modify send_email later. 
@@ -3303,13 +6088,12 @@ def parent_contact_professor():
             body=message_body
         )
         db.session.add(new_msg)
+        # Email Notification, delivered once the message is saved
+        queue_email(prof.email, email_subject, html_content, category="message", text_body=text_content)
         db.session.commit()
     except Exception as e:
         print(f"Error saving message to DB: {e}")
     
-    # Send Email Notification
-    send_email(prof.email, email_subject, html_content)
-    
     return jsonify({"success": True, "message": f"Message sent to Prof. {prof.name}"})
 
 
@@ -3381,7 +6165,7 @@ def get_conversation_thread(student_id):
 @roles_allowed(["professor"])
 def reply_to_parent():
     identity = get_jwt_identity()
-    prof = User.query.get(identity)
+    prof = get_current_user()
     
     data = request.json or {}
     student_id = data.get("student_id") # Use Student ID context
@@ -3405,23 +6189,14 @@ def reply_to_parent():
             is_read=True # Faculty read their own message
         )
         db.session.add(new_msg)
+
+        # 2. Queue Email
+        subject = f"Re: Query regarding {student.name} - [Prof. {prof.name}]"
+        html_content, text_content = render_email_template("faculty_reply", professor_name=prof.name, reply=reply_body)
+        queue_email(student.parent_email, subject, html_content, category="message", text_body=text_content)
         db.session.commit()
     except Exception as e:
         print("DB Save Error:", e)
-
-    # 2. Send Email
-    subject = f"Re: Query regarding {student.name} - [Prof. {prof.name}]"
-    html_content = f"""
-    <div style="font-family: Arial, sans-serif; padding: 20px;">
-        <p><strong>From:</strong> Prof. {prof.name}</p>
-        <hr/>
-        <p>{reply_body}</p>
-        <p style="color: #666; font-size: 12px; margin-top: 20px;">
-           Reply strictly via email or check the portal.
-        </p>
-    </div>
-    """
-    send_email(student.parent_email, subject, html_content)
     return jsonify({"success": True, "message": "Reply sent"})
 
 
@@ -3430,7 +6205,7 @@ def reply_to_parent():
 def get_parent_conversations():
     """Returns list of professors the student/parent has chatted with."""
     identity = get_jwt_identity()
-    student = User.query.get(identity)
+    student = get_current_user()
     
     # Get all messages where this student is involved
     msgs = Message.query.filter_by(student_id=student.id).order_by(Message.created_at.desc()).all()
@@ -3490,7 +6265,7 @@ def get_parent_thread(faculty_id):
 @roles_allowed(["parent"]) # Only parent can reply, student read-only? Let's allow parent.
 def parent_reply():
     identity = get_jwt_identity()
-    student = User.query.get(identity)
+    student = get_current_user()
     
     data = request.json or {}
     faculty_id = data.get("faculty_id")
@@ -3514,20 +6289,14 @@ def parent_reply():
             is_read=False
         )
         db.session.add(new_msg)
+
+        # 2. Queue Email to Faculty
+        subject = f"New Message from Parent of {student.name}"
+        html_content, text_content = render_email_template("parent_reply", reply=reply_body)
+        queue_email(prof.email, subject, html_content, category="message", text_body=text_content)
         db.session.commit()
     except Exception as e:
         print("DB Save Error:", e)
-
-    # 2. Send Email to Faculty
-    subject = f"New Message from Parent of {student.name}"
-    html_content = f"""
-    <div style="padding: 20px;">
-        <p><strong>Parent Reply:</strong></p>
-        <p>{reply_body}</p>
-        <p style="color: #666; font-size: 12px; margin-top: 20px;">Login to portal to reply.</p>
-    </div>
-    """
-    send_email(prof.email, subject, html_content)
     
     return jsonify({"success": True, "message": "Reply sent"})
 
@@ -3576,7 +6345,7 @@ def create_daily_message_with_ai(msg_type, user_name):
 @jwt_required()
 def upload_routine():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     # 1. Get Content (Text or File)
     raw_text = request.form.get('routine_text', '')
@@ -3704,7 +6473,7 @@ def delete_routine():
 @jwt_required()
 def get_today_status():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     today = datetime.utcnow().date()
     day_name = today.strftime("%A")
 
@@ -3765,7 +6534,7 @@ def mark_attendance():
     { "type": "no_class" }
     """
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     today = datetime.utcnow().date()
     
     # Prevent double marking
@@ -3955,6 +6724,7 @@ def manage_trainers():
         TrainerAllocation.query.filter_by(trainer_id=trainer_id).delete()
         db.session.delete(trainer)
         db.session.commit()
+        invalidate_user_cache(trainer.id)
         return jsonify({"success": True, "message": "Trainer deleted successfully"})
     
     # POST - Create new trainer
@@ -3990,6 +6760,7 @@ def manage_hrd_subjects():
         sub = HRDSubject(name=name, semester=int(sem))
         db.session.add(sub)
         db.session.commit()
+        invalidate_reference("hrd_subjects")
         return jsonify({"success": True, "id": sub.id})
     elif request.method == "DELETE":
         data = request.json or {}
@@ -4005,10 +6776,14 @@ def manage_hrd_subjects():
         TrainerAllocation.query.filter_by(hrd_subject_id=subject_id).delete()
         db.session.delete(sub)
         db.session.commit()
+        invalidate_reference("hrd_subjects")
         return jsonify({"success": True, "message": "Subject deleted successfully"})
     else:
-        subs = HRDSubject.query.filter_by(is_active=True).all()
-        return jsonify({"success": True, "subjects": [{"id": s.id, "name": s.name, "semester": s.semester} for s in subs]})
+        subjects = cached_reference("hrd_subjects", lambda: [
+            {"id": s.id, "name": s.name, "semester": s.semester}
+            for s in HRDSubject.query.filter_by(is_active=True).all()
+        ])
+        return jsonify({"success": True, "subjects": subjects})
 
 @app.route("/hrd/chro/allocate", methods=["POST"])
 @hrd_required()
@@ -4160,35 +6935,23 @@ def get_hrd_students():
     uid = get_jwt_identity()
     claims = get_jwt()
     role = claims.get("role") or "student"
+    q = User.query.filter_by(role="student")
     
     # Optional Allocation Filtering (For Trainers/CHRO)
     allocation_id = request.args.get("allocation_id")
-    if allocation_id:
-        alloc = TrainerAllocation.query.get(allocation_id)
-        if alloc:
-            # Strictly filter by allocation criteria
-            students = User.query.filter_by(
-                role="student", 
-                degree=alloc.degree, 
-                semester=alloc.semester, 
-                section=alloc.section
-            ).all()
-            return jsonify({
-                "success": True, 
-                "students": [{"id": s.id, "name": s.name, "srn": s.srn, "degree": s.degree, "semester": s.semester, "section": s.section} for s in students]
-            })
+    alloc = TrainerAllocation.query.get(allocation_id) if allocation_id else None
+    if alloc:
+        # Strictly filter by allocation criteria
+        q = q.filter_by(degree=alloc.degree, semester=alloc.semester, section=alloc.section)
 
     # CHRO: See All
-    if role == "chro" or role == "admin":
+    elif role == "chro" or role == "admin":
         # Filters
         sem = request.args.get("semester")
         sec = request.args.get("section")
         
-        q = User.query.filter_by(role="student")
         if sem: q = q.filter_by(semester=int(sem))
         if sec: q = q.filter_by(section=sec)
-        
-        students = q.all()
     
     # Trainer: See Allocated Only
     elif role in ["trainer", "hrd_trainer"]:
@@ -4197,15 +6960,16 @@ def get_hrd_students():
             return jsonify({"success": True, "students": []})
             
         valid_combos = set((a.semester, a.section) for a in allocs)
-        all_s = User.query.filter_by(role="student").all()
-        students = [s for s in all_s if (s.semester, s.section) in valid_combos]
+        q = q.filter(or_(*[and_(User.semester == sem, User.section == sec) for sem, sec in valid_combos]))
         
     else:
         return jsonify({"success": False, "message": "Unauthorized"}), 403
-        
+
+    students, page = keyset_paginate(q, [User.id], lambda s: (s.id,), descending=False)
     return jsonify({
         "success": True, 
-        "students": [{"id": s.id, "name": s.name, "srn": s.srn, "degree": s.degree, "semester": s.semester, "section": s.section} for s in students]
+        "students": [{"id": s.id, "name": s.name, "srn": s.srn, "degree": s.degree, "semester": s.semester, "section": s.section} for s in students],
+        **page
     })
 
 
@@ -4229,15 +6993,16 @@ def manage_companies():
         )
         db.session.add(c)
         db.session.commit()
+        invalidate_reference("companies")
         return jsonify({"success": True, "company": {"id": c.id, "name": c.name}})
     
     else:
         # GET
-        comps = Company.query.filter_by(is_active=True).order_by(Company.created_at.desc()).all()
-        return jsonify({"success": True, "companies": [
+        companies = cached_reference("companies", lambda: [
             {"id": c.id, "name": c.name, "sector": c.sector, "hr_name": c.hr_name, "hr_email": c.hr_email}
-            for c in comps
-        ]})
+            for c in Company.query.filter_by(is_active=True).order_by(Company.created_at.desc()).all()
+        ])
+        return jsonify({"success": True, "companies": companies})
 
 @app.route("/hrd/companies/<int:company_id>", methods=["PUT", "DELETE"])
 @hrd_required()
@@ -4248,6 +7013,7 @@ def update_company(company_id):
     if request.method == "DELETE":
         c.is_active = False # Soft delete
         db.session.commit()
+        invalidate_reference("companies")
         return jsonify({"success": True, "message": "Company deactivated"})
         
     data = request.json or {}
@@ -4255,10 +7021,13 @@ def update_company(company_id):
         if k in data: setattr(c, k, data[k])
     
     db.session.commit()
+    invalidate_reference("companies")
     return jsonify({"success": True, "message": "Updated"})
 
 # --- DRIVE MANAGEMENT (EXTENSIVE) ---
 
+DRIVE_APPLICATION_STATUSES = ["applied", "shortlisted", "offered", "rejected"]
+
 @app.route("/hrd/drives", methods=["GET", "POST"])
 @hrd_required(allow_trainer=True)
 def manage_drives():
@@ -4300,23 +7069,53 @@ def manage_drives():
         return jsonify({"success": True, "drive_id": drive.id})
 
     else:
-        drives = PlacementDrive.query.order_by(PlacementDrive.created_at.desc()).all()
+        # Filters: status, company_id, date_from / date_to (YYYY-MM-DD, on created_at)
+        status = request.args.get("status")
+        company_id = request.args.get("company_id")
+        try:
+            date_from = datetime.strptime(request.args["date_from"], "%Y-%m-%d") if request.args.get("date_from") else None
+            date_to = datetime.strptime(request.args["date_to"], "%Y-%m-%d") + timedelta(days=1) if request.args.get("date_to") else None
+            company_id = int(company_id) if company_id else None
+        except ValueError:
+            return jsonify({"success": False, "message": "Invalid filter parameters"}), 400
+
+        # Applicant counts per drive and status, aggregated once instead of per drive
+        counts = db.session.query(
+            DriveApplication.drive_id.label("drive_id"),
+            func.count(DriveApplication.id).label("total"),
+            *[func.sum(case((DriveApplication.status == st, 1), else_=0)).label(st) for st in DRIVE_APPLICATION_STATUSES]
+        ).group_by(DriveApplication.drive_id).subquery()
+
+        q = db.session.query(
+            PlacementDrive.id, PlacementDrive.title, PlacementDrive.role, PlacementDrive.ctc_min,
+            PlacementDrive.ctc_max, PlacementDrive.status, PlacementDrive.eligibility_criteria,
+            PlacementDrive.created_at, PlacementDrive.company_id, Company.name.label("company_name"),
+            counts.c.total, *[counts.c[st] for st in DRIVE_APPLICATION_STATUSES]
+        ).outerjoin(Company, Company.id == PlacementDrive.company_id).\
+            outerjoin(counts, counts.c.drive_id == PlacementDrive.id)
+
+        if status: q = q.filter(PlacementDrive.status == status)
+        if company_id: q = q.filter(PlacementDrive.company_id == company_id)
+        if date_from: q = q.filter(PlacementDrive.created_at >= date_from)
+        if date_to: q = q.filter(PlacementDrive.created_at < date_to)
+
+        drives, page = keyset_paginate(q, [PlacementDrive.created_at, PlacementDrive.id], lambda d: (d.created_at, d.id))
         out = []
         for d in drives:
-            c = Company.query.get(d.company_id)
-            # Count applicants
-            app_count = DriveApplication.query.filter_by(drive_id=d.id).count()
             out.append({
                 "id": d.id,
                 "title": d.title,
-                "company": c.name if c else "Unknown",
+                "company": d.company_name or "Unknown",
+                "company_id": d.company_id,
                 "role": d.role,
                 "ctc": f"{d.ctc_min}-{d.ctc_max} LPA",
                 "status": d.status,
-                "applicant_count": app_count,
-                "criteria": d.eligibility_criteria
+                "applicant_count": d.total or 0,
+                "applicant_counts": {st: getattr(d, st) or 0 for st in DRIVE_APPLICATION_STATUSES},
+                "criteria": d.eligibility_criteria,
+                "created_at": d.created_at.isoformat() if d.created_at else None
             })
-        return jsonify({"success": True, "drives": out})
+        return jsonify({"success": True, "drives": out, **page})
 
 @app.route("/hrd/drives/<int:drive_id>", methods=["GET"])
 @hrd_required(allow_trainer=True)
@@ -4336,7 +7135,7 @@ def get_drive_details(drive_id):
                 "id": s.id, "name": s.name, "srn": s.srn, "email": s.email,
                 "status": app.status,
                 "skills": prof.skills if prof else [],
-                "resume_url": prof.resume_url if prof else None,
+                "resume_url": resume_link(prof),
                 "cv_score": 85 # Placeholder for AI Score
             })
             
@@ -4377,26 +7176,29 @@ def manage_offers():
         app_rec = DriveApplication.query.filter_by(drive_id=data["drive_id"], student_id=data["student_id"]).first()
         if app_rec:
             app_rec.status = "offered"
-            
-        db.session.commit()
         
         # Notify Student
         s = User.query.get(data["student_id"])
         if s:
-            send_professional_email(
+            queue_professional_email(
                 s.email, "Placement Offer Received!", "Congratulations!", 
                 {"Role": data["role"], "CTC": f"{data['ctc']} LPA"}, 
-                "You have received a formal offer."
+                "You have received a formal offer.",
+                category="placement"
             )
             
+        db.session.commit()
+            
         return jsonify({"success": True, "message": "Offer generated"})
         
     else:
-        offers = PlacementOffer.query.order_by(PlacementOffer.offer_date.desc()).all()
+        offers, page = keyset_paginate(
+            PlacementOffer.query, [PlacementOffer.offer_date, PlacementOffer.id], lambda o: (o.offer_date, o.id)
+        )
         return jsonify({"success": True, "offers": [{
             "id": o.id, "role": o.role, "ctc": o.ctc, "status": o.status,
             "student_id": o.student_id
-        } for o in offers]})
+        } for o in offers], **page})
 
 # --- AI & ANALYTICS ---
 
@@ -4437,7 +7239,7 @@ def get_hrd_analytics():
         
         Provide a 2-sentence macro-strategic insight for the CHRO. Focus on bottlenecks or high-level trends.
         """
-        ai_res = groq_ai_call([{"role": "user", "content": prompt}], temperature=0.5)
+        ai_res = groq_ai_call([{"role": "user", "content": prompt}], temperature=0.5, cache_ttl=AI_SUMMARY_CACHE_TTL)
         if isinstance(ai_res, str): ai_summary = ai_res
 
     return jsonify({
@@ -4462,7 +7264,7 @@ def student_placement_profile():
             "success": True,
             "profile": {
                 "skills": prof.skills,
-                "resume_url": prof.resume_url,
+                "resume_url": resume_link(prof),
                 "linkedin_url": prof.linkedin_url,
                 "portfolio_url": prof.portfolio_url,
                 "preferred_role": prof.preferred_role
@@ -4477,7 +7279,7 @@ def student_placement_profile():
             
         # Update fields
         if "skills" in data: prof.skills = data["skills"]
-        if "resume_url" in data: prof.resume_url = data["resume_url"]
+        if "resume_url" in data: set_resume_link(prof, data["resume_url"])
         if "linkedin_url" in data: prof.linkedin_url = data["linkedin_url"]
         if "portfolio_url" in data: prof.portfolio_url = data["portfolio_url"]
         if "preferred_role" in data: prof.preferred_role = data["preferred_role"]
@@ -4490,28 +7292,35 @@ def student_placement_profile():
 @jwt_required()
 def upload_student_resume():
     uid = get_jwt_identity()
-    if 'file' not in request.files:
+    upload_id = request.form.get("upload_id") or (request.get_json(silent=True) or {}).get("upload_id")
+    if 'file' not in request.files and not upload_id:
         return jsonify({"success": False, "message": "No file"}), 400
-    file = request.files['file']
-    if file.filename == '' or not allowed_file(file.filename):
+    file = request.files.get('file')
+    if file and (file.filename == '' or not allowed_file(file.filename)):
         return jsonify({"success": False, "message": "Invalid file type"}), 400
     
-    ext = file.filename.rsplit(".", 1)[1].lower()
-    dest_key = f"resumes/student_{uid}_{uuid.uuid4().hex[:8]}.{ext}"
-    
     try:
-        presigned_url, key = upload_to_minio(file, dest_key, content_type="application/pdf")
+        if file:
+            url, key = upload_to_minio(file, new_object_key("resumes/", file.filename, uid), content_type="application/pdf")
+        else:
+            # Uploaded straight to storage via /uploads/presign
+            key = complete_direct_upload(upload_id, "resume")
+            url = presigned_url(key)
         
-        # Update Profile
+        # Update Profile: keep the key, not the URL (presigned URLs expire after an hour)
         prof = StudentPlacementProfile.query.filter_by(student_id=uid).first()
         if not prof:
             prof = StudentPlacementProfile(student_id=uid)
             db.session.add(prof)
         
-        prof.resume_url = presigned_url
+        prof.resume_key = key
+        prof.resume_etag = object_etag(key)
+        prof.resume_url = None
         prof.profile_updated_at = datetime.utcnow()
         db.session.commit()
-        return jsonify({"success": True, "url": presigned_url})
+        return jsonify({"success": True, "url": url})
+    except DirectUploadError:
+        raise
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
@@ -4522,7 +7331,7 @@ def student_delete_resume():
     try:
         prof = StudentPlacementProfile.query.filter_by(student_id=uid).first()
         if prof:
-            prof.resume_url = None
+            prof.resume_url = None; prof.resume_key = None; prof.resume_etag = None
             prof.profile_updated_at = datetime.utcnow()
             db.session.commit()
         return jsonify({"success": True, "message": "Resume removed from profile"})
@@ -4537,7 +7346,7 @@ def student_delete_resume():
 def get_eligible_drives():
     """Returns placement drives the student is eligible for based on degree, semester, section, CGPA"""
     uid = get_jwt_identity()
-    student = User.query.get(uid)
+    student = get_current_user()
     if not student or student.role != "student":
         return jsonify({"success": False, "message": "Student not found"}), 404
     
@@ -4725,31 +7534,22 @@ def mark_hrd_attendance():
         return jsonify({"success": False, "message": "Missing fields"}), 400
         
     date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-    trainer_id = get_jwt_identity()
-    
-    count = 0
-    for rec in records:
-        stu_id = rec.get("student_id")
-        status = rec.get("status")
-        
-        # Check specific allocation? (Optional strict check)
-        
-        # Upsert Attendance
-        existing = HRDAttendance.query.filter_by(student_id=stu_id, hrd_subject_id=sid, date=date_obj).first()
-        if existing:
-            existing.status = status
-            existing.trainer_id = trainer_id # Update who modified
-            existing.timestamp = datetime.utcnow()
-        else:
-            new_att = HRDAttendance(
-                student_id=stu_id,
-                hrd_subject_id=sid,
-                trainer_id=trainer_id,
-                date=date_obj,
-                status=status
-            )
-            db.session.add(new_att)
-        count += 1
+    trainer_id = int(get_jwt_identity())
+    now = datetime.utcnow()
+    
+    # Check specific allocation? (Optional strict check)
+    
+    # Upsert Attendance in one statement; trainer_id records who last modified
+    rows = [{
+        "student_id": rec.get("student_id"),
+        "hrd_subject_id": sid,
+        "trainer_id": trainer_id,
+        "date": date_obj,
+        "status": rec.get("status"),
+        "timestamp": now,
+    } for rec in records]
+    upsert(HRDAttendance, rows, ["student_id", "hrd_subject_id", "date"], ["status", "trainer_id", "timestamp"])
+    count = len(rows)
         
     db.session.commit()
     return jsonify({"success": True, "message": f"Attendance marked for {count} students."})
@@ -4779,18 +7579,79 @@ app.register_blueprint(attendance_bp, url_prefix='/attendance')
 
 # --- NEURAL PROFILE (AI STUDENT OVERVIEW) ---
 
-def extract_resume_text(url):
-    """Downloads PDF from URL and extracts up to 3 pages of text."""
-    if not url or not PdfReader:
+def owned_resume_key(prof, url):
+    """
+    The storage key in a resume URL, only if it is this student's own resume upload.
+    URLs come from clients, so a key pointing anywhere else (another student's resume, a
+    receipt) must never be presigned on their behalf; such URLs stay external links.
+    """
+    key = object_key_from_url(url)
+    if key and (key == prof.resume_key or key.startswith(f"resumes/student_{prof.student_id}_")):
+        return key
+    return None
+
+
+def profile_resume_key(prof):
+    """Storage key of the profile's resume; older rows only kept a presigned URL, so derive it from that."""
+    if not prof:
+        return None
+    return prof.resume_key or owned_resume_key(prof, prof.resume_url)
+
+
+def resume_link(prof):
+    """Download link minted at response time: a fresh presigned URL, or the external link as saved."""
+    if not prof:
+        return None
+    key = profile_resume_key(prof)
+    return presigned_url(key) if key else prof.resume_url
+
+
+def set_resume_link(prof, url):
+    # Clients may echo back a presigned URL we handed out; keep the key it points at instead
+    key = owned_resume_key(prof, url)
+    if key:
+        if key != prof.resume_key:
+            prof.resume_key, prof.resume_etag = key, None
+        prof.resume_url = None
+    else:
+        prof.resume_url = url or None
+        prof.resume_key = prof.resume_etag = None
+
+
+resume_text_cache = LocalCacheBackend(max_entries=512)
+
+
+def extract_resume_text(key=None, etag=None, url=None):
+    """
+    Reads a resume PDF and extracts up to 3 pages of text. Stored resumes are streamed with
+    get_object (text cached per ETag, so unchanged resumes are read once); url is only for
+    external links.
+    """
+    if not (key or url) or not PdfReader:
         if not PdfReader:
             print("Skipping extraction: pypdf not installed.")
         return ""
+    cache_key = f"{key}:{etag}" if key and etag else None
+    if cache_key:
+        cached = resume_text_cache.get(cache_key)
+        if cached is not None:
+            return cached
     try:
-        print(f"DEBUG: Downloading resume from {url}")
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        
-        pdf_file = io.BytesIO(response.content)
+        # pypdf needs a seekable file; spool the stream (memory up to 8 MB, then disk)
+        pdf_file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, dir=TEMP_DIR)
+        if key:
+            body = get_object_stream(key)
+            try:
+                for chunk in iter(lambda: body.read(STORAGE_CHUNK_SIZE), b""):
+                    pdf_file.write(chunk)
+            finally:
+                body.close()
+        else:
+            print(f"DEBUG: Downloading resume from {url}")
+            response = requests.get(url, timeout=15)
+            response.raise_for_status()
+            pdf_file.write(response.content)
+        pdf_file.seek(0)
         reader = PdfReader(pdf_file)
         text = ""
         page_count = len(reader.pages)
@@ -4805,8 +7666,9 @@ def extract_resume_text(url):
         print(f"DEBUG: Extracted {extracted_len} characters from PDF")
         
         if extracted_len < 20: # Arbitrary threshold for "practically empty"
-            return "NOTICE: This PDF appears to be a scanned image or uses non-standard encoding. No selectable text was found. Advice: Re-upload a text-based PDF (exported from Word/Canva) for better AI analysis."
-            
+            text = "NOTICE: This PDF appears to be a scanned image or uses non-standard encoding. No selectable text was found. Advice: Re-upload a text-based PDF (exported from Word/Canva) for better AI analysis."
+        if cache_key:
+            resume_text_cache.set(cache_key, text.strip())
         return text.strip()
     except Exception as e:
         err_msg = f"ERROR: Extraction failed - {str(e)}"
@@ -4849,7 +7711,8 @@ def get_student_neural_profile(student_id):
     # 1. Profile & Skills
     prof = StudentPlacementProfile.query.filter_by(student_id=student.id).first()
     skills = prof.skills if prof else []
-    resume_url = prof.resume_url if prof else None
+    resume_key = profile_resume_key(prof)
+    resume_url = resume_link(prof)
     
     # 2. Attendance Stats
     att_records = HRDAttendance.query.filter_by(student_id=student.id).all()
@@ -4869,7 +7732,12 @@ def get_student_neural_profile(student_id):
         })
         
     # 4. Neural Insight (Groq AI Powered)
-    resume_text = extract_resume_text(resume_url) if resume_url else "No resume uploaded."
+    if resume_key:
+        resume_text = extract_resume_text(key=resume_key, etag=prof.resume_etag)
+    elif resume_url:
+        resume_text = extract_resume_text(url=resume_url)
+    else:
+        resume_text = "No resume uploaded."
     
     prompt = f"""
     Analyze student: {student.name}
@@ -4892,7 +7760,7 @@ def get_student_neural_profile(student_id):
     }}
     """
     
-    ai_insight = groq_ai_call([{"role": "user", "content": prompt}], json_mode=True)
+    ai_insight = groq_ai_call([{"role": "user", "content": prompt}], json_mode=True, cache_ttl=AI_CACHE_TTL)
     
     # Handle AI failure
     if "error" in ai_insight:
@@ -4962,9 +7830,22 @@ def get_student_hrd_performance():
     }})
 
 
+# -------------------- APP FACTORY --------------------
+
+def create_app(init_database=None):
+    """
+    Returns the configured application, initialising the database first unless disabled.
+    WSGI servers load it through wsgi.py; routes and extensions are bound at import time.
+    """
+    if DB_INIT_ON_START if init_database is None else init_database:
+        init_db_once()
+    return app
+
+
 if __name__ == "__main__":
-    with app.app_context():
-        init_db()
-        print("Using GROQ_API_KEY:", (GROQ_API_KEY[:8] + "********") if GROQ_API_KEY else "NOT SET")
-        print("JWT_SECRET_KEY loaded:", True if JWT_SECRET_KEY else False)
-    app.run(debug=True, host='0.0.0.0', port=FLASK_RUN_PORT)
+    # Development server only; production runs gunicorn -c gunicorn.conf.py wsgi:app
+    create_app(init_database=True)
+    start_background_workers()
+    print("Using GROQ_API_KEY:", (GROQ_API_KEY[:8] + "********") if GROQ_API_KEY else "NOT SET")
+    print("JWT_SECRET_KEY loaded:", True if JWT_SECRET_KEY else False)
+    app.run(debug=APP_ENV == "development", host='0.0.0.0', port=FLASK_RUN_PORT)
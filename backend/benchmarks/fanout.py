@@ -0,0 +1,217 @@
+"""
+Load benchmark for the notification fan-out endpoints, against local SMTP and S3 stand-ins.
+
+    python benchmarks/fanout.py --students 500
+    python benchmarks/fanout.py --students 2000 --scenarios fee,notice --smtp-handshake-ms 40 --output fanout.json
+
+Seeds a throwaway SQLite database with N approved students in one class (each with a
+parent email), then calls each endpoint once through the Flask test client:
+
+    fee      POST /admin/fees/create   batch fee demand to the class
+    notice   POST /create-notice       notice with an attachment
+    note     POST /upload-note         study material upload
+
+For every scenario it reports the request wall time, queries issued (X-DB-Queries),
+peak Python allocation during the request, emails queued, and how long the outbox
+workers took to deliver them to the SMTP stand-in. Results are printed as JSON so runs
+can be diffed across commits. Run from backend/ so `app` is importable.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.standins import S3StandIn, SMTPStandIn  # noqa: E402
+
+SCENARIOS = ("fee", "notice", "note")
+DEGREE, SEMESTER, SECTION = "BCA", 1, "A"
+
+
+def configure_environment(args, smtp):
+    """Points the app at a scratch database and the stand-ins; must run before `import app`."""
+    host, port = smtp.server_address
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(args.workdir, 'fanout.db')}",
+        "APP_ENV": "development",  # X-DB-Queries is only reported outside production
+        "SMTP_HOST": host, "SMTP_PORT": str(port), "SMTP_STARTTLS": "0",
+        "SMTP_USER": "bench", "SMTP_PASS": "bench",
+        "EMAIL_WORKERS": str(args.email_workers), "EMAIL_POLL_INTERVAL": "0.2",
+        "ABSENCE_ALERT_MODE": "immediate",  # keep the digest scheduler out of the measurements
+    })
+
+
+def seed(app_module, students):
+    """Bulk-inserts the admin, a professor and N students. Returns (admin_token, professor_token)."""
+    from flask_jwt_extended import create_access_token
+    db, User = app_module.db, app_module.User
+
+    db.session.execute(db.insert(User), [
+        {"name": "Bench Admin", "email": "admin@bench.local", "password_hash": "-", "role": "admin", "status": "APPROVED"},
+        {"name": "Bench Professor", "email": "prof@bench.local", "password_hash": "-", "role": "professor", "status": "APPROVED"},
+    ] + [
+        {"name": f"Student {i}", "email": f"student{i}@bench.local", "parent_email": f"parent{i}@bench.local",
+         "srn": f"BENCH{i:06d}", "password_hash": "-", "role": "student", "status": "APPROVED",
+         "degree": DEGREE, "semester": SEMESTER, "section": SECTION}
+        for i in range(students)
+    ])
+    db.session.commit()
+
+    admin = User.query.filter_by(email="admin@bench.local").one()
+    prof = User.query.filter_by(email="prof@bench.local").one()
+    return (create_access_token(identity=str(admin.id), additional_claims={"role": "admin"}),
+            create_access_token(identity=str(prof.id), additional_claims={"role": "professor"}))
+
+
+def build_requests(admin_token, prof_token, attachment_kb):
+    """Returns {scenario: callable(client) -> response}."""
+    # Distinct bytes per scenario, or content-addressed storage would skip the second upload
+    payload = {name: b"%PDF-1.4\n" + os.urandom(attachment_kb * 1024) for name in ("notice", "note")}
+    class_form = {"degree": DEGREE, "semester": str(SEMESTER), "section": SECTION, "subject": "Data Structures"}
+
+    def fee(client):
+        return client.post("/admin/fees/create", headers={"Authorization": f"Bearer {admin_token}"}, json={
+            "title": "Exam fee", "amount_cents": 150000, "due_date": "2030-01-31", "target": "batch",
+            "degree": DEGREE, "semester": SEMESTER, "sections": SECTION,
+        })
+
+    def notice(client):
+        return client.post("/create-notice", headers={"Authorization": f"Bearer {prof_token}"},
+                           content_type="multipart/form-data", data=dict(
+                               class_form, title="Lab schedule", message="Lab sessions move to Thursday.",
+                               attachment=(io.BytesIO(payload["notice"]), "schedule.pdf", "application/pdf")))
+
+    def note(client):
+        return client.post("/upload-note", headers={"Authorization": f"Bearer {prof_token}"},
+                           content_type="multipart/form-data", data=dict(
+                               class_form, title="Unit 1 notes", document_type="Notes",
+                               file=(io.BytesIO(payload["note"]), "unit1.pdf", "application/pdf")))
+
+    return {"fee": fee, "notice": notice, "note": note}
+
+
+def outbox_count(app_module, *statuses):
+    EmailOutbox = app_module.EmailOutbox
+    with app_module.app.app_context():
+        q = EmailOutbox.query
+        if statuses:
+            q = q.filter(EmailOutbox.status.in_(statuses))
+        return q.count()
+
+
+def wait_for_outbox(app_module, timeout):
+    """Blocks until no message is pending or being sent. Returns False on timeout."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if not outbox_count(app_module, "pending", "sending"):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run_scenario(name, send, app_module, client, smtp, s3, timeout):
+    # Requests run outside any app context so each gets its own `g` (and query counters)
+    outbox_before = outbox_count(app_module)
+    smtp_before, s3_before = smtp.accepted, sum(s3.requests.values())
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = send(client)
+    request_s = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    drained = wait_for_outbox(app_module, timeout)
+    delivered_s = time.perf_counter() - started
+    queued = outbox_count(app_module) - outbox_before
+    delivered = smtp.accepted - smtp_before
+
+    return {
+        "scenario": name,
+        "status_code": response.status_code,
+        "request_ms": round(request_s * 1000, 2),
+        "db_queries": int(response.headers.get("X-DB-Queries", 0)),
+        "db_time_ms": float(response.headers.get("X-DB-Time", "0ms").rstrip("ms")),
+        "s3_requests": sum(s3.requests.values()) - s3_before,
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "emails_queued": queued,
+        "emails_delivered": delivered,
+        "outbox_drained": drained,
+        "delivery_s": round(delivered_s, 3),
+        "emails_per_sec": round(delivered / delivered_s, 1) if delivered_s else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--email-workers", type=int, default=2, help="outbox worker threads")
+    parser.add_argument("--smtp-handshake-ms", type=float, default=0.0, help="simulated per-connection SMTP setup cost")
+    parser.add_argument("--s3-latency-ms", type=float, default=0.0, help="simulated per-request S3 round trip")
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for the outbox to drain")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    smtp = SMTPStandIn(handshake_delay=args.smtp_handshake_ms / 1000.0).start()
+    s3 = S3StandIn(request_delay=args.s3_latency_ms / 1000.0).start()
+
+    with tempfile.TemporaryDirectory(prefix="noteorbit-bench-") as workdir:
+        args.workdir = workdir
+        configure_environment(args, smtp)
+
+        import boto3
+        from botocore.config import Config
+        import app as app_module
+
+        # Route uploads to the in-memory S3 stand-in instead of the configured MinIO endpoint
+        app_module.storage = app_module.S3StorageBackend(boto3.client(
+            "s3", endpoint_url=s3.endpoint_url, region_name="us-east-1",
+            aws_access_key_id="bench", aws_secret_access_key="bench",
+            config=Config(s3={"addressing_style": "path"}, request_checksum_calculation="when_required"),
+        ))
+
+        app = app_module.create_app(init_database=True)
+        with app.app_context():
+            seed_started = time.perf_counter()
+            admin_token, prof_token = seed(app_module, args.students)
+            seed_s = time.perf_counter() - seed_started
+        app_module.email_workers.start()
+
+        requests = build_requests(admin_token, prof_token, args.attachment_kb)
+        client = app.test_client()
+        results = [run_scenario(name, requests[name], app_module, client, smtp, s3, args.timeout) for name in scenarios]
+        app_module.email_workers.stop()
+
+    report = {
+        "students": args.students,
+        "email_workers": args.email_workers,
+        "smtp_handshake_ms": args.smtp_handshake_ms,
+        "s3_latency_ms": args.s3_latency_ms,
+        "seed_s": round(seed_s, 3),
+        "smtp_connections": smtp.connections,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "scenarios": results,
+    }
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(out + "\n")
+    return 0 if all(r["status_code"] == 200 and r["outbox_drained"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Throughput of upload_to_minio for large files under different multipart part sizes and concurrency.
+
+    python benchmarks/multipart_throughput.py --size-mb 100
+    python benchmarks/multipart_throughput.py --endpoint http://127.0.0.1:9000 --access-key minioadmin \
+        --secret-key minioadmin --configs 8:1,8:4,16:4,32:8
+
+Each config is PART_MB:CONCURRENCY. The source is a temp file on disk, as werkzeug spools
+large request bodies, and is streamed straight into the transfer manager. Without
+--endpoint the in-memory S3 stand-in is used; --latency-ms then adds a delay per S3
+request (i.e. per part) to stand in for a remote MinIO, and max RSS includes the stand-in's
+in-memory copy of the object. Run from backend/ so `app` is importable.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3  # noqa: E402
+from boto3.s3.transfer import TransferConfig  # noqa: E402
+from botocore.config import Config  # noqa: E402
+
+import app as app_module  # noqa: E402
+from benchmarks.standins import S3StandIn  # noqa: E402
+
+
+def parse_configs(spec):
+    configs = []
+    for item in spec.split(","):
+        part_mb, _, concurrency = item.strip().partition(":")
+        configs.append((int(part_mb), int(concurrency or 1)))
+    return configs
+
+
+def run(source_path, size, part_mb, concurrency):
+    app_module.s3_transfer_config = TransferConfig(
+        multipart_threshold=part_mb * 1024 * 1024, multipart_chunksize=part_mb * 1024 * 1024,
+        max_concurrency=concurrency, use_threads=concurrency > 1,
+    )
+    reported = []
+    key = f"bench/multipart-{part_mb}-{concurrency}.bin"
+    with open(source_path, "rb") as f:
+        started = time.perf_counter()
+        app_module.upload_to_minio(f, key, "application/octet-stream", on_progress=lambda sent, total: reported.append(sent))
+        elapsed = time.perf_counter() - started
+    app_module.storage.delete(key)
+    assert reported and max(reported) == size, "progress callback did not account for every byte"
+    mb = size / 1048576
+    print(f"{part_mb:>4} MB parts x{concurrency:<3} {mb:7.1f} MB  {elapsed:7.2f}s  {mb / elapsed:8.1f} MB/s  "
+          f"{-(-size // (part_mb * 1048576)):>4} parts  max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--configs", default="8:1,8:4,16:4,16:8,32:4", help="comma-separated PART_MB:CONCURRENCY")
+    parser.add_argument("--endpoint", help="S3/MinIO endpoint URL (default: in-memory stand-in)")
+    parser.add_argument("--access-key", default="minioadmin")
+    parser.add_argument("--secret-key", default="minioadmin")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="stand-in only: delay per S3 request")
+    args = parser.parse_args()
+
+    endpoint = args.endpoint
+    if not endpoint:
+        endpoint = S3StandIn(request_delay=args.latency_ms / 1000.0).start().endpoint_url
+    app_module.storage = app_module.S3StorageBackend(boto3.client(
+        "s3", endpoint_url=endpoint, region_name="us-east-1",
+        aws_access_key_id=args.access_key, aws_secret_access_key=args.secret_key,
+        config=Config(s3={"addressing_style": "path"}, request_checksum_calculation="when_required",
+                      max_pool_connections=64),
+    ))
+
+    size = args.size_mb * 1024 * 1024
+    with tempfile.NamedTemporaryFile(prefix="noteorbit-bench-") as src:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            src.write(block)
+        src.flush()
+        print(f"{args.size_mb} MB file -> {endpoint}" + ("" if args.endpoint else f" (stand-in, {args.latency_ms:.0f}ms/request)"))
+        for part_mb, concurrency in parse_configs(args.configs):
+            run(src.name, size, part_mb, concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Throughput of pooled SMTP sessions vs. one connection per message, against a local SMTP stand-in.
+
+    python benchmarks/smtp_throughput.py --messages 500 --threads 4 --handshake-ms 40
+
+The stand-in speaks plain SMTP (no TLS); --handshake-ms adds a delay to each new
+connection's greeting to stand in for the TCP + STARTTLS + AUTH round trips of a real
+relay. Run from backend/ so `app` is importable.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import SMTPConnectionPool, build_email_message, render_professional_email  # noqa: E402
+from benchmarks.standins import SMTPStandIn  # noqa: E402
+
+
+def send_unpooled(host, port, sender, to_email, subject, body, text_body=None):
+    """The pre-pool behaviour: connect, send one message, quit."""
+    import smtplib
+    server = smtplib.SMTP(host, port, timeout=30)
+    try:
+        server.sendmail(sender, to_email, build_email_message(sender, to_email, subject, body, text_body))
+    finally:
+        server.quit()
+
+
+def run(label, send_fn, messages, threads, server):
+    body, text_body = render_professional_email("Fee Notification", {"Title": "Exam fee", "Amount": "INR 1500"}, "A new fee payment is due.")
+    before_conn, before_msgs = server.connections, server.accepted
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: send_fn(f"student{i}@example.edu", "Fee Demand: Exam fee", body, text_body), range(messages)))
+    elapsed = time.perf_counter() - started
+    delivered = server.accepted - before_msgs
+    print(f"{label:<10} {delivered:>6} msgs  {elapsed:7.2f}s  {delivered / elapsed:8.1f} msg/s  "
+          f"{server.connections - before_conn:>5} connections")
+    return delivered / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent senders (outbox worker threads)")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--handshake-ms", type=float, default=40.0, help="simulated per-connection setup cost")
+    args = parser.parse_args()
+
+    server = SMTPStandIn(handshake_delay=args.handshake_ms / 1000.0).start()
+    host, port = server.server_address
+    sender = "noreply@noteorbit.local"
+
+    print(f"{args.messages} messages, {args.threads} sender threads, {args.handshake_ms:.0f}ms handshake")
+    unpooled = run("unpooled", lambda to, subj, body, text_body: send_unpooled(host, port, sender, to, subj, body, text_body),
+                   args.messages, args.threads, server)
+    pool = SMTPConnectionPool(host, port, sender=sender, size=args.pool_size, starttls=False)
+    pooled = run("pooled", pool.send, args.messages, args.threads, server)
+    pool.close_all()
+    server.shutdown()
+    print(f"speedup    {pooled / unpooled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+In-process stand-ins for the services the backend talks to, so benchmarks run without
+a mail relay or MinIO:
+
+    SMTPStandIn   plain SMTP (EHLO/AUTH/MAIL/RCPT/DATA), accepts and discards messages
+    S3StandIn     path-style S3 subset (bucket HEAD/PUT, ListObjectsV2, DeleteObjects, object
+                  PUT/GET/HEAD/DELETE, ranged GET, multipart uploads, browser POST uploads) kept
+                  in memory; signatures and POST policies are not checked
+
+Both listen on 127.0.0.1 with an ephemeral port and serve from daemon threads.
+"""
+import hashlib
+import re
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, unescape
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), handshake_delay=0.0, message_delay=0.0):
+        super().__init__(address, SMTPStandInHandler)
+        self.handshake_delay = handshake_delay
+        self.message_delay = message_delay
+        self.accepted = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """Minimal RFC 5321 responder: accepts any AUTH and discards every message."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake_delay)
+        self.reply("220 standin ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self.reply("250-standin\r\n250-AUTH PLAIN LOGIN\r\n250 SIZE 52428800")
+            elif cmd.startswith("AUTH"):
+                self.reply("235 Authentication successful")
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif cmd == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(self.server.message_delay)
+                with self.server.lock:
+                    self.server.accepted += 1
+                self.reply("250 OK queued")
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class S3StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), request_delay=0.0):
+        super().__init__(address, S3StandInHandler)
+        self.request_delay = request_delay
+        self.buckets = {}
+        self.multipart = {}  # upload id -> ({part number: bytes}, content type)
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, op):
+        with self.lock:
+            self.requests[op] = self.requests.get(op, 0) + 1
+
+    def put_object(self, bucket, key, data, content_type="application/octet-stream", etag=None, modified=None):
+        """Stores an object directly (also used to seed buckets). Returns its ETag."""
+        etag = etag or '"%s"' % hashlib.md5(data).hexdigest()
+        self.buckets.setdefault(bucket, {})[key] = (data, etag, content_type, modified or datetime.now(timezone.utc))
+        return etag
+
+
+class S3StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _target(self):
+        path, _, query = self.path.partition("?")
+        bucket, _, key = unquote(path.lstrip("/")).partition("/")
+        return bucket, key, {k: v[0] for k, v in parse_qs(query, keep_blank_values=True).items()}
+
+    def _bucket_query(self, bucket, query, body):
+        """ListObjectsV2 (continuation token = last key returned) and DeleteObjects."""
+        objects = self.server.buckets[bucket]
+        xml = {"Content-Type": "application/xml"}
+        if "delete" in query:
+            for k in re.findall(r"<Key>(.*?)</Key>", body.decode()):
+                objects.pop(unescape(k), None)
+            return self._respond(200, b"<DeleteResult></DeleteResult>", xml)
+        prefix = query.get("prefix", "")
+        after = query.get("continuation-token") or query.get("start-after") or ""
+        limit = int(query.get("max-keys") or 1000)
+        keys = sorted(k for k in list(objects) if k.startswith(prefix) and k > after)
+        page, truncated = keys[:limit], len(keys) > limit
+        entries = "".join(
+            f"<Contents><Key>{escape(k)}</Key><LastModified>{objects[k][3].strftime('%Y-%m-%dT%H:%M:%S.000Z')}</LastModified>"
+            f"<ETag>{escape(objects[k][1])}</ETag><Size>{len(objects[k][0])}</Size></Contents>"
+            for k in page if k in objects
+        )
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        return self._respond(200, (
+            f"<ListBucketResult><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<MaxKeys>{limit}</MaxKeys><IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{entries}{token}</ListBucketResult>"
+        ).encode(), xml)
+
+    def _multipart(self, bucket, key, query, body):
+        """CreateMultipartUpload / UploadPart / CompleteMultipartUpload / AbortMultipartUpload."""
+        server = self.server
+        xml = {"Content-Type": "application/xml"}
+        if self.command == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with server.lock:
+                server.multipart[upload_id] = ({}, self.headers.get("Content-Type", "application/octet-stream"))
+            return self._respond(200, (
+                f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            ).encode(), xml)
+        upload = server.multipart.get(query.get("uploadId"))
+        if upload is None:
+            return self._error(404, "NoSuchUpload")
+        parts, content_type = upload
+        if self.command == "PUT":
+            parts[int(query["partNumber"])] = body
+            return self._respond(200, headers={"ETag": '"%s"' % hashlib.md5(body).hexdigest()})
+        with server.lock:
+            server.multipart.pop(query["uploadId"], None)
+        if self.command == "DELETE":
+            return self._respond(204)
+        numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+        data = b"".join(parts[n] for n in numbers)
+        etag = '"%s-%d"' % (hashlib.md5(b"".join(hashlib.md5(parts[n]).digest() for n in numbers)).hexdigest(), len(numbers))
+        server.put_object(bucket, key, data, content_type, etag)
+        return self._respond(200, (
+            f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+            f"<ETag>{etag}</ETag></CompleteMultipartUploadResult>"
+        ).encode(), xml)
+
+    def _error(self, status, code):
+        self._respond(status, f"<?xml version=\"1.0\"?><Error><Code>{code}</Code></Error>".encode(),
+                      {"Content-Type": "application/xml"})
+
+    def _handle(self):
+        server = self.server
+        time.sleep(server.request_delay)
+        bucket, key, query = self._target()
+        server.count(f"{self.command} {'object' if key else 'bucket'}")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)) if self.command in ("PUT", "POST") else b""
+
+        if not key and bucket in server.buckets and ("list-type" in query or "delete" in query):
+            return self._bucket_query(bucket, query, body)
+
+        if self.command == "POST" and not key:
+            # Presigned POST: multipart form with the policy fields, then the file
+            form = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + self.headers.get("Content-Type", "").encode() + b"\r\n\r\n" + body
+            )
+            fields = {part.get_param("name", header="content-disposition"): part for part in form.iter_parts()}
+            if bucket not in server.buckets or "key" not in fields or "file" not in fields:
+                return self._error(400, "InvalidRequest")
+            data = fields["file"].get_payload(decode=True)
+            content_type = fields["Content-Type"].get_content() if "Content-Type" in fields else "application/octet-stream"
+            etag = server.put_object(bucket, fields["key"].get_content(), data, content_type)
+            return self._respond(204, headers={"ETag": etag})
+
+        if not key:
+            if self.command == "PUT":
+                server.buckets.setdefault(bucket, {})
+                return self._respond(200)
+            if bucket in server.buckets:
+                return self._respond(200)
+            return self._error(404, "NoSuchBucket")
+
+        objects = server.buckets.get(bucket)
+        if objects is None:
+            return self._error(404, "NoSuchBucket")
+        if "uploads" in query or "uploadId" in query:
+            return self._multipart(bucket, key, query, body)
+        if self.command == "PUT":
+            etag = server.put_object(bucket, key, body, self.headers.get("Content-Type", "application/octet-stream"))
+            return self._respond(200, headers={"ETag": etag})
+        if self.command == "DELETE":
+            objects.pop(key, None)
+            return self._respond(204)
+        if key not in objects:
+            return self._error(404, "NoSuchKey")
+        data, etag, content_type, _ = objects[key]
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and self.command == "GET":
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            return self._respond(206, data[start:end + 1], {
+                "ETag": etag, "Content-Type": content_type, "Content-Range": f"bytes {start}-{end}/{len(data)}",
+            })
+        return self._respond(200, data, {"ETag": etag, "Content-Type": content_type})
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _handle
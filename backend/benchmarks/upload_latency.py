@@ -0,0 +1,77 @@
+"""
+Upload latency of upload_to_minio with a per-upload bucket probe vs. the cached check, against a local S3 stand-in.
+
+    python benchmarks/upload_latency.py --uploads 200 --size-kb 256 --latency-ms 30
+
+--latency-ms delays every S3 request at the stand-in to stand in for the round trip
+through the tunnelled MinIO endpoint; with it, the saved head_bucket call shows up
+directly in per-upload latency. Run from backend/ so `app` is importable.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3  # noqa: E402
+from botocore.config import Config  # noqa: E402
+
+import app as app_module  # noqa: E402
+from benchmarks.standins import S3StandIn  # noqa: E402
+
+
+def upload_probing(file_obj, dest_key, content_type="application/octet-stream"):
+    """The previous behaviour: head_bucket (and create_bucket on failure) before every upload."""
+    s3 = app_module.storage.client
+    try:
+        s3.head_bucket(Bucket=app_module.S3_BUCKET)
+    except Exception:
+        try:
+            s3.create_bucket(Bucket=app_module.S3_BUCKET)
+        except Exception:
+            pass
+    s3.upload_fileobj(file_obj, app_module.S3_BUCKET, dest_key, ExtraArgs={"ContentType": content_type})
+    return app_module.presigned_url(dest_key), dest_key
+
+
+def run(label, upload_fn, uploads, payload, server):
+    before = sum(server.requests.values())
+    timings = []
+    for i in range(uploads):
+        started = time.perf_counter()
+        upload_fn(io.BytesIO(payload), f"bench/{label}/{i}.pdf", "application/pdf")
+        timings.append((time.perf_counter() - started) * 1000)
+    requests = sum(server.requests.values()) - before
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<10} {uploads:>5} uploads  mean {statistics.mean(timings):7.2f}ms  "
+          f"p50 {statistics.median(timings):7.2f}ms  p95 {p95:7.2f}ms  {requests / uploads:.2f} S3 requests/upload")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="simulated per-request S3 round trip")
+    args = parser.parse_args()
+
+    server = S3StandIn(request_delay=args.latency_ms / 1000.0).start()
+    app_module.storage = app_module.S3StorageBackend(boto3.client(
+        "s3", endpoint_url=server.endpoint_url, region_name="us-east-1",
+        aws_access_key_id="bench", aws_secret_access_key="bench",
+        config=Config(s3={"addressing_style": "path"}, request_checksum_calculation="when_required"),
+    ))
+    payload = os.urandom(args.size_kb * 1024)
+
+    print(f"{args.uploads} uploads of {args.size_kb} KB, {args.latency_ms:.0f}ms per S3 request")
+    before = run("probing", upload_probing, args.uploads, payload, server)
+    after = run("cached", app_module.upload_to_minio, args.uploads, payload, server)
+    print(f"saved      {before - after:.2f}ms per upload ({before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,14 @@ module.exports = {
     apps: [
         {
             name: "praman-backend",
-            script: "app.py",
+            script: "./venv/bin/gunicorn",
+            args: "-c gunicorn.conf.py wsgi:app",
             interpreter: "./venv/bin/python",
             env: {
                 "FLASK_RUN_PORT": 5000,
-                "PYTHONUNBUFFERED": "1"
+                "PYTHONUNBUFFERED": "1",
+                "APP_ENV": "production"
+                // WEB_CONCURRENCY / WEB_THREADS override the worker and thread counts
             }
         }
     ]
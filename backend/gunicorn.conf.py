@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for NoteOrbit. Everything is tunable through the environment:
+
+    WEB_CONCURRENCY   worker processes (default: 2 x cores + 1)
+    WEB_THREADS       threads per worker (default: 4; 1 switches to sync workers)
+    WEB_TIMEOUT       seconds before a silent worker is restarted (AI and upload calls are slow)
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('FLASK_RUN_PORT', 5000)}")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("WEB_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(os.getenv("WEB_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 2000))
+max_requests_jitter = 200
+accesslog = "-"
+
+# Import the app (and run init_db) once in the master, then fork workers from it
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened in the master during init must not be shared across processes
+    from app import app, db, start_background_workers
+    with app.app_context():
+        db.engine.dispose(close=False)
+    # Background threads do not survive fork; each worker runs its own outbox pool and digest scheduler
+    start_background_workers()